@@ -0,0 +1,162 @@
+from process_covid import get_rebinning_plan, SCHEMA_FILEPATH
+from stream_covid import iter_evolution
+
+COUNT_PATHS = ["epidemiology/confirmed/new",
+               "epidemiology/confirmed/total",
+               "hospitalizations/hospitalized/new",
+               "hospitalizations/hospitalized/total",
+               "hospitalizations/hospitalized/current",
+               "epidemiology/tested/new",
+               "epidemiology/tested/total",
+               ]
+POPULATION_KEYS = ["total", "male", "female", "rural", "urban"]
+
+
+def merge_age_binnings(age_binnings):
+    """
+    Finest binning every one of `age_binnings` can be rebinned to, as `merge_age_binning` does for two of them.
+    """
+    if len(age_binnings) == 0:
+        raise ValueError("At least one age binning is needed")
+    common_binning = list(age_binnings[0])
+    for age_binning in age_binnings[1:]:
+        common_binning = list(get_rebinning_plan(common_binning, age_binning).age_binning)
+    return common_binning
+
+
+def _rebin(values, age_binning, common_binning):
+    """Rebin `values` onto `common_binning`; a common bin is None when any bin summed into it is None."""
+    if list(age_binning) == list(common_binning):
+        return list(values)
+    bounds = get_rebinning_plan(age_binning, common_binning).bounds[0]
+    return [None if None in values[start:stop] else sum(values[start:stop]) for start, stop in bounds]
+
+
+def _add(value1, value2):
+    if value1 is None or value2 is None:
+        return None
+    if isinstance(value1, list):
+        return [_add(v1, v2) for v1, v2 in zip(value1, value2)]
+    return value1 + value2
+
+
+class CovidAggregate:
+    """
+    Sum of the confirmed, hospitalized and tested counts, and of the population, of several regions,
+    with the ages rebinned to the finest binning common to all of them.
+    Regions are added one at a time and only the sums are kept, so memory does not grow with
+    the number of regions. A total is None on a date where any region is missing it.
+    """
+
+    def __init__(self, name, key):
+        self.name = name
+        self.key = key
+        self.n_regions = 0
+        self.age_binning = None
+        self.population = {population_key: 0 for population_key in POPULATION_KEYS}
+        self.population["age"] = None
+        self.sums = {}  # {date: {metric path: total}}
+        self._n_regions_per_date = {}
+
+    def _set_age_binning(self, age_binning):
+        if self.age_binning is not None and self.age_binning != age_binning:
+            self.population["age"] = _rebin(self.population["age"], self.age_binning, age_binning)
+            for date_sums in self.sums.values():
+                for path, value in date_sums.items():
+                    if path.endswith("/age"):
+                        date_sums[path] = _rebin(value, self.age_binning, age_binning)
+        self.age_binning = age_binning
+
+    def add_region(self, header, evolution):
+        """Add one region, given its "metadata" and "region" entries and its {date: entry} evolution."""
+        self._add_counts(header, [(date, _extract_counts(entry)) for date, entry in evolution.items()])
+
+    def _add_counts(self, header, date_counts):
+        age_binning_population = header["metadata"]["age_binning"]["population"]
+        age_binning_cases = header["metadata"]["age_binning"]["hospitalizations"]
+        binnings = [age_binning_population, age_binning_cases]
+        if self.age_binning is not None:
+            binnings.insert(0, self.age_binning)
+        self._set_age_binning(merge_age_binnings(binnings))
+
+        population = header["region"]["population"]
+        for population_key in POPULATION_KEYS:
+            self.population[population_key] = _add(self.population[population_key], population[population_key])
+        population_age = _rebin(population["age"], age_binning_population, self.age_binning)
+        self.population["age"] = population_age if self.n_regions == 0 else _add(self.population["age"],
+                                                                                  population_age)
+
+        for date, counts in date_counts:
+            for path, value in counts.items():
+                if path.endswith("/age"):
+                    counts[path] = _rebin(value, age_binning_cases, self.age_binning)
+            if date in self.sums:
+                self.sums[date] = {path: _add(value, counts[path]) for path, value in self.sums[date].items()}
+            else:
+                self.sums[date] = counts
+            self._n_regions_per_date[date] = self._n_regions_per_date.get(date, 0) + 1
+        self.n_regions += 1
+
+    def result(self):
+        """The aggregate as a region document, accepted by the analysis functions of process_covid."""
+        dates = sorted(self.sums.keys())
+        evolution = {}
+        for date in dates:
+            complete = self._n_regions_per_date[date] == self.n_regions
+            entry = {}
+            for path, value in self.sums[date].items():
+                if not complete:
+                    value = [None] * len(self.age_binning) if path.endswith("/age") else None
+                *keys, last_key = path.split("/")
+                node = entry
+                for key in keys:
+                    node = node.setdefault(key, {})
+                node[last_key] = value
+            evolution[date] = entry
+
+        return {"metadata": {"time-range": {"start_date": dates[0] if dates else None,
+                                            "stop_date": dates[-1] if dates else None},
+                             "age_binning": {"hospitalizations": list(self.age_binning or []),
+                                             "population": list(self.age_binning or [])}},
+                "region": {"name": self.name, "key": self.key, "population": dict(self.population)},
+                "evolution": evolution,
+                }
+
+
+def _extract_counts(entry):
+    counts = {}
+    for count_path in COUNT_PATHS:
+        node = entry
+        for key in count_path.split("/"):
+            node = node[key]
+        for field in ["all", "male", "female", "age"]:
+            counts[f"{count_path}/{field}"] = node[field]
+    return counts
+
+
+def aggregate_groups(filepaths, group_by, schema=SCHEMA_FILEPATH, validate=True):
+    """
+    Aggregate region files into groups, e.g. regions into their nation.
+    group_by: function of a region's "region" entry returning the (name, key) of its group.
+    Each file is streamed once, keeping only the counts of its dates, so a single region
+    document is never held in memory as a whole.
+    Returns {group key: aggregated region document}.
+    """
+    aggregates = {}
+    for filepath in filepaths:
+        header = {}
+        date_counts = [(date, _extract_counts(entry))
+                       for date, entry in iter_evolution(filepath, header, schema, validate)]
+        name, key = group_by(header["region"])
+        if key not in aggregates:
+            aggregates[key] = CovidAggregate(name, key)
+        aggregates[key]._add_counts(header, date_counts)
+    return {key: aggregate.result() for key, aggregate in aggregates.items()}
+
+
+def aggregate_regions(filepaths, name="All regions", key="ALL", schema=SCHEMA_FILEPATH, validate=True):
+    """Aggregate all the region files into one region document."""
+    aggregates = aggregate_groups(filepaths, lambda region: (name, key), schema, validate)
+    if key not in aggregates:
+        raise ValueError("No region files to aggregate")
+    return aggregates[key]
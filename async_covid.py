@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+from process_covid import parse_covid_data, SCHEMA_FILEPATH
+from validate_schema import validate_data
+
+DEFAULT_CONCURRENCY = 8
+
+
+def _read_bytes(filepath):
+    with open(filepath, "rb") as json_file:
+        return json_file.read()
+
+
+async def read_file(filepath):
+    """Read a file in a worker thread, so that slow storage does not block the event loop."""
+    return await asyncio.to_thread(_read_bytes, filepath)
+
+
+class SlowFileSource:
+    """
+    File source waiting `latency` seconds before each read, to simulate network-mounted storage.
+    It keeps track of the reads in flight, e.g. to check the concurrency bound of a pipeline.
+    """
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.n_reads = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, filepath):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return _read_bytes(filepath)
+        finally:
+            self.in_flight -= 1
+            self.n_reads += 1
+
+
+def _validate_content(schema, content):
+    return validate_data(schema, json.loads(content))
+
+
+def _load_and_process(content, filepath, process, schema, validate, columnar):
+    data = parse_covid_data(content, filepath, schema, validate, columnar)
+    return data if process is None else process(data)
+
+
+async def load_covid_data_async(filepath, schema=SCHEMA_FILEPATH, validate=True, columnar=False,
+                                read=read_file, executor=None):
+    """
+    `load_covid_data` reading the file with the coroutine `read`, then parsing and validating it
+    in `executor` (default: the event loop's thread pool).
+    """
+    content = await read(filepath)
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, parse_covid_data, content, filepath, schema, validate, columnar)
+
+
+async def validate_schema_async(schema_filepath, json_filepath, read=read_file, executor=None):
+    """`validate_schema` reading the file with the coroutine `read`."""
+    content = await read(json_filepath)
+    return await asyncio.get_running_loop().run_in_executor(executor, _validate_content, schema_filepath, content)
+
+
+async def iter_covid_data(filepaths, process=None, schema=SCHEMA_FILEPATH, validate=True, columnar=False,
+                          read=read_file, concurrency=DEFAULT_CONCURRENCY, workers=1, buffer_size=None,
+                          executor=None):
+    """
+    Load the region files concurrently, yielding (filepath, result, exception) as each one completes.
+    Up to `concurrency` files are read at once with the coroutine `read`, while `workers` of the files
+    already read are parsed, validated and passed to `process` in `executor` (default: the event loop's
+    thread pool; more than one worker only pays off with a process pool).
+    result: the loaded data, or what `process` returned for it; None if an exception was raised.
+    At most `buffer_size` (default: `concurrency`) files wait to be parsed, and as many results wait
+    to be consumed. Reading pauses while these are full, so memory stays bounded however many files
+    there are and however slowly the results are consumed.
+    """
+    buffer_size = buffer_size or concurrency
+    loop = asyncio.get_running_loop()
+    pending = iter(filepaths)
+    contents = asyncio.Queue(buffer_size)
+    results = asyncio.Queue(buffer_size)
+    done = object()
+
+    async def reader():
+        for filepath in pending:
+            try:
+                content = await read(filepath)
+            except Exception as exception:
+                await results.put((filepath, None, exception))
+                continue
+            await contents.put((filepath, content))
+
+    async def worker():
+        while True:
+            filepath, content = await contents.get()
+            if filepath is done:
+                return
+            try:
+                result = await loop.run_in_executor(executor, _load_and_process, content, filepath, process,
+                                                    schema, validate, columnar)
+                outcome = (filepath, result, None)
+            except Exception as exception:
+                outcome = (filepath, None, exception)
+            del content
+            await results.put(outcome)
+
+    async def run():
+        readers = [asyncio.create_task(reader()) for _ in range(concurrency)]
+        workers_tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        try:
+            await asyncio.gather(*readers)
+            for _ in workers_tasks:
+                await contents.put((done, None))
+            await asyncio.gather(*workers_tasks)
+        finally:
+            for task in readers + workers_tasks:
+                task.cancel()
+        await results.put(done)
+
+    pipeline = asyncio.create_task(run())
+    try:
+        while True:
+            outcome = await results.get()
+            if outcome is done:
+                break
+            yield outcome
+        await pipeline
+    finally:
+        if not pipeline.done():
+            pipeline.cancel()
+            await asyncio.gather(pipeline, return_exceptions=True)
@@ -0,0 +1,190 @@
+import glob
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from matplotlib.figure import Figure
+
+from process_covid import (load_covid_data,
+                           cases_per_population_by_age,
+                           hospital_vs_confirmed,
+                           count_high_rain_low_tests_days,
+                           render_confirmed_plot,
+                           SCHEMA_FILEPATH)
+
+ANALYSES = {"cases_per_population_by_age": cases_per_population_by_age,
+            "hospital_vs_confirmed": hospital_vs_confirmed,
+            "count_high_rain_low_tests_days": count_high_rain_low_tests_days,
+            }
+
+DEFAULT_MAX_AGES = (25, 50, 75, 200)
+
+
+def find_region_files(path, schema=SCHEMA_FILEPATH):
+    """
+    Region files matching `path`, either a directory (all its .json files) or a glob pattern.
+    The schema file is skipped when it sits next to the region files.
+    """
+    pattern = os.path.join(path, "*.json") if os.path.isdir(path) else path
+    schema_path = os.path.abspath(schema) if isinstance(schema, str) else None
+    return sorted(filepath for filepath in glob.glob(pattern)
+                  if os.path.abspath(filepath) != schema_path)
+
+
+def _error_message(exception):
+    return f"{type(exception).__name__}: {exception}"
+
+
+def process_region_file(filepath, analyses, schema=SCHEMA_FILEPATH):
+    """
+    Load and validate one region file and run each of `analyses` (names from ANALYSES) on it.
+    Returns the region key, the results of the analyses that succeeded, and the error messages of the others.
+    """
+    data = load_covid_data(filepath, schema, columnar=True)
+    results, errors = {}, []
+    for name in analyses:
+        try:
+            results[name] = ANALYSES[name](data)
+        except Exception as exception:
+            errors.append(f"{name}: {_error_message(exception)}")
+    return data["region"]["key"], results, errors
+
+
+def process_covid_batch(path, analyses=tuple(ANALYSES), workers=None, schema=SCHEMA_FILEPATH):
+    """
+    Run `analyses` on every region file found by `find_region_files(path)`, in a pool of `workers`
+    processes (default: one per core; 1 runs everything in the current process).
+    A file that cannot be loaded, or an analysis that fails, does not abort the batch.
+    A region key found in several files is kept from the first of them in sorted order.
+    Returns:
+      results: {region key: {analysis name: result}}
+      errors: {filepath: [error messages]}
+    """
+    analyses = tuple(analyses)
+    unknown = set(analyses) - set(ANALYSES)
+    if unknown:
+        raise ValueError(f"Unknown analyses {sorted(unknown)}, choose from {list(ANALYSES)}")
+    filepaths = find_region_files(path, schema)
+    results, errors = {}, {}
+
+    def collect(filepath, outcome):
+        key, region_results, region_errors = outcome
+        if key in results:
+            region_errors = [f"Region key '{key}' already loaded from another file"]
+        else:
+            results[key] = region_results
+        if region_errors:
+            errors[filepath] = region_errors
+
+    if workers == 1:
+        for filepath in filepaths:
+            try:
+                collect(filepath, process_region_file(filepath, analyses, schema))
+            except Exception as exception:
+                errors[filepath] = [_error_message(exception)]
+        return results, errors
+
+    outcomes = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_region_file, filepath, analyses, schema): filepath
+                   for filepath in filepaths}
+        for future in as_completed(futures):
+            try:
+                outcomes[futures[future]] = future.result()
+            except Exception as exception:
+                errors[futures[future]] = [_error_message(exception)]
+    # In the order of the files, so a duplicate region key is resolved as in a single process
+    for filepath in filepaths:
+        if filepath in outcomes:
+            collect(filepath, outcomes[filepath])
+    return results, errors
+
+
+def render_region_plots(filepath, output_dir, fmt="png", max_ages=DEFAULT_MAX_AGES, status="total",
+                        schema=SCHEMA_FILEPATH):
+    """
+    Render the sex and age confirmed-cases plots of one region file, reusing a single figure.
+    The plots are named after the region key, as region names need not be unique.
+    Returns [(output filepath, seconds taken)] for each plot.
+    """
+    data = load_covid_data(filepath, schema, columnar=True)
+    figure = Figure(figsize=(10, 10))
+    timings = []
+    for sex, plot_max_ages in [(True, []), (False, max_ages)]:
+        start = time.perf_counter()
+        output_filepath = render_confirmed_plot(data, sex, plot_max_ages, status, output_dir, fmt, figure,
+                                                name=data["region"]["key"])
+        timings.append((output_filepath, time.perf_counter() - start))
+    return timings
+
+
+def _render_staged(filepath, output_dir, *arguments):
+    """
+    `render_region_plots` into a new staging directory inside `output_dir`, so that no plot is written
+    under its final name before the batch decides which file owns it. Returns (staging dir, timings).
+    """
+    staging_dir = tempfile.mkdtemp(prefix=".staging_", dir=output_dir)
+    try:
+        return staging_dir, render_region_plots(filepath, staging_dir, *arguments)
+    except Exception:
+        shutil.rmtree(staging_dir)
+        raise
+
+
+def render_plots_batch(path, output_dir, fmt="png", max_ages=DEFAULT_MAX_AGES, status="total", workers=None,
+                       schema=SCHEMA_FILEPATH):
+    """
+    Render the plots of `render_region_plots` for every region file found by `find_region_files(path)`
+    in a pool of `workers` processes (1 renders in the current process).
+    Two files rendering to the same output filepath (i.e. with the same region key) are a collision:
+    the plots are kept for the first file in sorted order, and the other gets an error. Each file renders
+    into its own staging directory, and its plots are moved to `output_dir` only once it owns their names;
+    a file that fails writes no plot.
+    Returns:
+      timings: {output filepath: seconds taken to render it}
+      errors: {filepath: [error messages]}
+      total: wall time of the whole batch, in seconds
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    filepaths = find_region_files(path, schema)
+    timings, errors = {}, {}
+    arguments = (output_dir, fmt, tuple(max_ages), status, schema)
+
+    def collect(filepath, outcome):
+        staging_dir, staged_timings = outcome
+        region_timings = [(os.path.join(output_dir, os.path.basename(staged_filepath)), staged_filepath, seconds)
+                          for staged_filepath, seconds in staged_timings]
+        collisions = [output_filepath for output_filepath, _, _ in region_timings if output_filepath in timings]
+        if collisions:
+            errors[filepath] = [f"Plot '{output_filepath}' already rendered from another file"
+                                for output_filepath in collisions]
+        else:
+            for output_filepath, staged_filepath, seconds in region_timings:
+                os.replace(staged_filepath, output_filepath)
+                timings[output_filepath] = seconds
+        shutil.rmtree(staging_dir)
+
+    if workers == 1:
+        for filepath in filepaths:
+            try:
+                collect(filepath, _render_staged(filepath, *arguments))
+            except Exception as exception:
+                errors[filepath] = [_error_message(exception)]
+        return timings, errors, time.perf_counter() - start
+
+    outcomes = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_render_staged, filepath, *arguments): filepath for filepath in filepaths}
+        for future in as_completed(futures):
+            try:
+                outcomes[futures[future]] = future.result()
+            except Exception as exception:
+                errors[futures[future]] = [_error_message(exception)]
+    # In the order of the files, so collisions are resolved as in a single process
+    for filepath in filepaths:
+        if filepath in outcomes:
+            collect(filepath, outcomes[filepath])
+    return timings, errors, time.perf_counter() - start
@@ -0,0 +1,492 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import instrument_covid
+from async_covid import iter_covid_data, SlowFileSource
+from cache_covid import CovidDataCache
+from lazy_covid import LazyCovidData
+from records_covid import to_records
+from batch_covid import process_covid_batch, ANALYSES
+from process_covid import (load_covid_data, to_columnar, cases_per_population_by_age, hospital_vs_confirmed,
+                           count_high_rain_low_tests_days, compute_running_average, get_series, CovidQuery,
+                           SCHEMA_FILEPATH)
+from stream_covid import stream_covid_data
+from validate_schema import validate_schema, load_schema, recursive_check, SchemaValidator
+
+SAMPLE_FILEPATH = "covid_data/ER-Mi-EV_2020-03-16_2020-04-24.json"
+RESULTS_FILEPATH = "benchmark_results.json"
+
+
+def scale_region_data(input_data, n_dates):
+    """
+    Return a copy of `input_data` whose evolution holds `n_dates` consecutive days,
+    made by cycling over the date entries of the original file.
+    """
+    entries = list(input_data["evolution"].values())
+    start = datetime.date.fromisoformat(next(iter(input_data["evolution"])))
+    evolution = {}
+    for i in range(n_dates):
+        evolution[(start + datetime.timedelta(days=i)).isoformat()] = entries[i % len(entries)]
+    scaled_data = dict(input_data)
+    scaled_data["evolution"] = evolution
+    scaled_data["metadata"] = dict(input_data["metadata"],
+                                   **{"time-range": {"start_date": min(evolution), "stop_date": max(evolution)}})
+    return scaled_data
+
+
+def write_scaled_file(directory, n_dates, sample_filepath=SAMPLE_FILEPATH, region_key=None):
+    with open(sample_filepath) as json_file:
+        input_data = json.load(json_file)
+    scaled_data = scale_region_data(input_data, n_dates)
+    if region_key is not None:
+        scaled_data["region"] = dict(scaled_data["region"], key=region_key)
+    filepath = os.path.join(directory, f"scaled_{n_dates}_{region_key or scaled_data['region']['key']}.json")
+    with open(filepath, "w") as json_file:
+        json.dump(scaled_data, json_file)
+    return filepath
+
+
+def time_call(function, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _load_covid_data_double_parse(filepath):
+    # Loading as done before the single-parse loader: validate from disk, then parse again
+    if not validate_schema(SCHEMA_FILEPATH, filepath):
+        raise ValueError(f"Incorrect schema given in {filepath}")
+    with open(filepath) as json_file:
+        return json.load(json_file)
+
+
+def bench_load(n_dates_list=(40, 1000, 10000)):
+    with tempfile.TemporaryDirectory() as directory:
+        for n_dates in n_dates_list:
+            filepath = write_scaled_file(directory, n_dates)
+            size_mb = os.path.getsize(filepath) / 2**20
+            before = time_call(_load_covid_data_double_parse, filepath)
+            after = time_call(load_covid_data, filepath)
+            print(f"load_covid_data {n_dates:>6} dates ({size_mb:7.2f} MB): "
+                  f"before {before / size_mb:.4f} s/MB, after {after / size_mb:.4f} s/MB, "
+                  f"speedup x{before / after:.2f}")
+
+
+def bench_columnar(n_dates_list=(40, 1000, 10000)):
+    with open(SAMPLE_FILEPATH) as json_file:
+        sample_data = json.load(json_file)
+    analyses = (cases_per_population_by_age, hospital_vs_confirmed, count_high_rain_low_tests_days)
+    for n_dates in n_dates_list:
+        data = scale_region_data(sample_data, n_dates)
+        columnar_data = to_columnar(data)
+        for analysis in analyses:
+            nested = time_call(analysis, data)
+            columnar = time_call(analysis, columnar_data)
+            print(f"{analysis.__name__} {n_dates:>6} dates: nested {nested * 1e3:.2f} ms, "
+                  f"columnar {columnar * 1e3:.2f} ms")
+
+
+def _compute_running_average_rescan(data, window):
+    # Running average as computed before the prefix-sum version: rescan the window for every element
+    shift = (window - 1) // 2
+    result = []
+    for i in range(len(data)):
+        if i < shift or i >= len(data) - shift:
+            result.append(None)
+        else:
+            values = [x for x in data[i-shift:i+shift+1] if x is not None]
+            result.append(sum(values) / len(values) if values else None)
+    return result
+
+
+def bench_running_average(n_values_list=(1000, 100000), windows=(7, 31)):
+    for n_values in n_values_list:
+        data = [None if random.random() < 0.05 else random.randint(0, 1000) for _ in range(n_values)]
+        for window in windows:
+            before = time_call(_compute_running_average_rescan, data, window)
+            after = time_call(compute_running_average, data, window)
+            print(f"compute_running_average {n_values:>7} values, window {window:>2}: "
+                  f"before {before * 1e3:.2f} ms, after {after * 1e3:.2f} ms")
+
+
+def peak_memory(function, *args):
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_stream(n_dates_list=(40, 1000, 10000)):
+    with tempfile.TemporaryDirectory() as directory:
+        for n_dates in n_dates_list:
+            filepath = write_scaled_file(directory, n_dates)
+            full = peak_memory(load_covid_data, filepath)
+            streamed = peak_memory(stream_covid_data, filepath, [])
+            print(f"peak memory {n_dates:>6} dates: load_covid_data {full / 2**20:.2f} MB, "
+                  f"stream_covid_data {streamed / 2**20:.2f} MB")
+
+
+def bench_batch(n_regions=16, n_dates=1000, workers_list=(1, 2, 4, 8)):
+    with tempfile.TemporaryDirectory() as directory:
+        for idx_region in range(n_regions):
+            write_scaled_file(directory, n_dates, region_key=f"R{idx_region}")
+        reference = None
+        for workers in workers_list:
+            start = time.perf_counter()
+            results, errors = process_covid_batch(directory, ANALYSES.keys(), workers)
+            duration = time.perf_counter() - start
+            if errors or len(results) != n_regions:
+                raise RuntimeError(f"Batch benchmark failed: {errors}")
+            reference = reference or duration
+            print(f"process_covid_batch {n_regions} regions x {n_dates} dates, {workers} workers: "
+                  f"{n_regions / duration:.1f} regions/s, speedup x{reference / duration:.2f}")
+
+
+def bench_validate(n_dates_list=(40, 5000, 20000)):
+    with open(SAMPLE_FILEPATH) as json_file:
+        sample_data = json.load(json_file)
+    schema = load_schema(SCHEMA_FILEPATH)
+    validator = SchemaValidator(schema)
+    for n_dates in n_dates_list:
+        data = scale_region_data(sample_data, n_dates)
+        before = time_call(recursive_check, schema, data)
+        after = time_call(validator.validate, data)
+        print(f"schema validation {n_dates:>6} dates: recursive_check {before * 1e3:.2f} ms, "
+              f"SchemaValidator {after * 1e3:.2f} ms, speedup x{before / after:.2f}")
+
+
+def bench_cache(n_dates_list=(40, 1000, 10000)):
+    with tempfile.TemporaryDirectory() as directory:
+        cache = CovidDataCache(os.path.join(directory, "cache"))
+        for n_dates in n_dates_list:
+            filepath = write_scaled_file(directory, n_dates)
+            for columnar in [False, True]:
+                cold = time_call(load_covid_data, filepath, SCHEMA_FILEPATH, True, columnar)
+                load_covid_data(filepath, columnar=columnar, cache=cache)
+                warm = time_call(load_covid_data, filepath, SCHEMA_FILEPATH, True, columnar, cache)
+                print(f"load_covid_data {n_dates:>6} dates, columnar={columnar}: "
+                      f"no cache {cold * 1e3:.2f} ms, warm cache {warm * 1e3:.2f} ms")
+
+
+def bench_instrumentation(n_dates=1000):
+    data = generate_region_data(n_dates)
+    analyses = (cases_per_population_by_age, hospital_vs_confirmed, count_high_rain_low_tests_days)
+    for analysis in analyses:
+        disabled = time_call(analysis, data, repeat=10)
+        with instrument_covid.recording():
+            enabled = time_call(analysis, data, repeat=10)
+        print(f"{analysis.__name__} {n_dates} dates: instrumentation disabled {disabled * 1e3:.3f} ms, "
+              f"enabled {enabled * 1e3:.3f} ms")
+
+
+def bench_lazy(n_dates_list=(40, 1000, 10000)):
+    def narrow_query(load, filepath):
+        return get_series(load(filepath), "weather/rainfall")
+
+    def load(filepath):
+        return load_covid_data(filepath, validate=False)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for n_dates in n_dates_list:
+            filepath = write_scaled_file(directory, n_dates)
+            for query in [narrow_query, lambda load, filepath: hospital_vs_confirmed(load(filepath))]:
+                name = "rainfall series" if query is narrow_query else "hospital_vs_confirmed"
+                full = time_call(query, load, filepath)
+                lazy = time_call(query, LazyCovidData, filepath)
+                full_memory = peak_memory(query, load, filepath)
+                lazy_memory = peak_memory(query, LazyCovidData, filepath)
+                print(f"{name} {n_dates:>6} dates: load_covid_data {full * 1e3:.2f} ms "
+                      f"{full_memory / 2**20:.2f} MB, LazyCovidData {lazy * 1e3:.2f} ms "
+                      f"{lazy_memory / 2**20:.2f} MB")
+
+            # Reading one field of every entry once the file is indexed, against decoding every entry
+            with LazyCovidData(filepath) as lazy_data:
+                offsets = list(lazy_data.evolution_offsets.values())
+                decoded = time_call(lambda: [json.loads(lazy_data._buf[start:end])["weather"]["rainfall"]
+                                             for start, end in offsets], repeat=1)
+                lazy = time_call(lambda: [entry["weather"]["rainfall"]
+                                          for entry in lazy_data["evolution"].values()], repeat=1)
+                again = time_call(lambda: [entry["weather"]["rainfall"]
+                                           for entry in lazy_data["evolution"].values()], repeat=1)
+            print(f"rainfall of every entry {n_dates:>6} dates: json.loads of the entries {decoded * 1e3:.2f} ms, "
+                  f"LazyObject {lazy * 1e3:.2f} ms, read again {again * 1e3:.2f} ms")
+
+
+def bench_async(n_regions=32, n_dates=200, latency=0.05, concurrency_list=(1, 4, 16)):
+    async def run(filepaths, concurrency):
+        outcomes = [outcome async for outcome in iter_covid_data(filepaths, hospital_vs_confirmed,
+                                                                 read=SlowFileSource(latency),
+                                                                 concurrency=concurrency)]
+        if any(exception is not None for _, _, exception in outcomes):
+            raise RuntimeError("Async benchmark failed")
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepaths = [write_scaled_file(directory, n_dates, region_key=f"R{idx_region}")
+                     for idx_region in range(n_regions)]
+        for concurrency in concurrency_list:
+            start = time.perf_counter()
+            asyncio.run(run(filepaths, concurrency))
+            duration = time.perf_counter() - start
+            print(f"iter_covid_data {n_regions} regions x {n_dates} dates, {latency * 1e3:.0f} ms read latency, "
+                  f"concurrency {concurrency}: {n_regions / duration:.1f} regions/s")
+
+
+def bench_query(n_dates_list=(1000, 10000, 100000), window_days=30):
+    def filter_and_analyse(analysis, data, start_date):
+        # Before the query layer: copy the rows of the window out of every column, then analyse them
+        rows = [row for row, date in enumerate(data["dates"]) if date >= start_date]
+        window = dict(data, dates=[data["dates"][row] for row in rows],
+                      columns={path: [column[row] for row in rows] for path, column in data["columns"].items()})
+        return analysis(window)
+
+    for n_dates in n_dates_list:
+        data = to_columnar(generate_region_data(n_dates))
+        query = CovidQuery(data)
+        start_date = data["dates"][-window_days]
+        for analysis in [hospital_vs_confirmed, count_high_rain_low_tests_days]:
+            full = time_call(analysis, data)
+            filtered = time_call(filter_and_analyse, analysis, data, start_date)
+            bisected = time_call(analysis, data, start_date)
+            indexed = time_call(analysis, query, start_date)
+            print(f"{analysis.__name__} last {window_days} of {n_dates:>6} dates: all dates {full * 1e3:.3f} ms, "
+                  f"filter and copy {filtered * 1e3:.3f} ms, columnar store {bisected * 1e3:.3f} ms, "
+                  f"CovidQuery {indexed * 1e3:.3f} ms")
+
+
+def retained_memory(function, *args):
+    """Memory still allocated by `function(*args)` once it returns, i.e. the size of its result."""
+    tracemalloc.start()
+    result = function(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def bench_records(n_dates_list=(40, 1000, 10000), n_age_bins_list=(4, 20)):
+    for n_age_bins in n_age_bins_list:
+        for n_dates in n_dates_list:
+            content = json.dumps(generate_region_data(n_dates, n_age_bins))
+            nested = retained_memory(json.loads, content)
+            columnar = retained_memory(lambda: to_columnar(json.loads(content)))
+            records = retained_memory(lambda: to_records(json.loads(content)))
+            print(f"region footprint {n_dates:>6} dates x {n_age_bins:>2} age bins: nested {nested / 2**20:.2f} MB, "
+                  f"columnar {columnar / 2**20:.2f} MB, records {records / 2**20:.2f} MB "
+                  f"({records / n_dates:.0f} bytes/date, x{nested / records:.1f} smaller)")
+
+
+def _synthetic_value(leaf_type, rng, n_age_bins):
+    if leaf_type == "Integer":
+        return rng.randint(0, 100000)
+    if leaf_type == "Decimal":
+        return round(rng.uniform(0, 100), 3)
+    if leaf_type == "[Integer]":
+        return [rng.randint(0, 10000) for _ in range(n_age_bins)]
+    return "synthetic"
+
+
+def _synthetic_node(schema_node, rng, n_age_bins):
+    if isinstance(schema_node, dict):
+        return {key: _synthetic_node(value, rng, n_age_bins) for key, value in schema_node.items()}
+    return _synthetic_value(schema_node, rng, n_age_bins)
+
+
+def _synthetic_counts(rng, n_age_bins):
+    age = [rng.randint(0, 1000) for _ in range(n_age_bins)]
+    male = rng.randint(0, sum(age))
+    return {"all": sum(age), "male": male, "female": sum(age) - male, "age": age}
+
+
+def _synthetic_entry(rng, n_age_bins):
+    # The schema only spells out hospitalizations/hospitalized/new, the other counts are "<idem ...>" it
+    return {"hospitalizations": {kind: {status: _synthetic_counts(rng, n_age_bins)
+                                        for status in ["new", "total", "current"]}
+                                 for kind in ["hospitalized", "intensive_care", "ventilator"]},
+            "epidemiology": {kind: {status: _synthetic_counts(rng, n_age_bins) for status in ["new", "total"]}
+                             for kind in ["confirmed", "deceased", "recovered", "tested"]},
+            "weather": {"temperature": {"average": round(rng.uniform(-10, 30), 3),
+                                        "min": round(rng.uniform(-20, 10), 3),
+                                        "max": round(rng.uniform(10, 40), 3)},
+                        "rainfall": round(rng.uniform(0, 20), 3),
+                        "snowfall": round(rng.uniform(0, 5), 3),
+                        "dew_point": round(rng.uniform(-10, 20), 3),
+                        "relative_humidity": round(rng.uniform(0, 100), 3)},
+            "government_response": {"school_closing": rng.randint(0, 3),
+                                    "workplace_closing": rng.randint(0, 3),
+                                    "stringency_index": round(rng.uniform(0, 100), 2)},
+            }
+
+
+MIN_AGE_BINS, MAX_AGE_BINS = 2, 100
+
+
+def synthetic_age_binning(n_age_bins):
+    if not MIN_AGE_BINS <= n_age_bins <= MAX_AGE_BINS:
+        raise ValueError(f"The number of age bins must be from {MIN_AGE_BINS} to {MAX_AGE_BINS}, not {n_age_bins}")
+    width = 100 // n_age_bins
+    return [f"{i * width}-{(i + 1) * width - 1}" for i in range(n_age_bins - 1)] + [f"{(n_age_bins - 1) * width}-"]
+
+
+def generate_region_data(n_dates, n_age_bins=4, key="SYN", seed=0):
+    """
+    Synthetic region document shaped like covid_data/schema.json, with `n_dates` days
+    and `n_age_bins` age bins for both the population and the counts.
+    """
+    rng = random.Random(seed)
+    schema = load_schema(SCHEMA_FILEPATH)
+    start = datetime.date(2020, 1, 1)
+    dates = [(start + datetime.timedelta(days=i)).isoformat() for i in range(n_dates)]
+    region = _synthetic_node(schema["region"], rng, n_age_bins)
+    region.update(name=f"Synthetic {key}", key=key)
+    return {"metadata": {"time-range": {"start_date": dates[0], "stop_date": dates[-1]},
+                         "age_binning": {"hospitalizations": synthetic_age_binning(n_age_bins),
+                                         "population": synthetic_age_binning(n_age_bins)}},
+            "region": region,
+            "evolution": {date: _synthetic_entry(rng, n_age_bins) for date in dates},
+            }
+
+
+def write_region_files(directory, n_regions, n_dates, n_age_bins=4):
+    filepaths = []
+    for idx_region in range(n_regions):
+        filepaths.append(os.path.join(directory, f"synthetic_{idx_region}.json"))
+        with open(filepaths[-1], "w") as json_file:
+            json.dump(generate_region_data(n_dates, n_age_bins, f"SYN{idx_region}", seed=idx_region), json_file)
+    return filepaths
+
+
+def _over_regions(function, inputs):
+    def run():
+        for input_value in inputs:
+            function(*input_value)
+    return run
+
+
+def run_suite(n_dates_list=(100, 1000, 10000), n_age_bins_list=(4, 20), n_regions=1, repeat=3):
+    """
+    Time the hot paths of process_covid on synthetic region files for every combination of
+    date count and age-bin count. Returns one record per function and size, with the best time
+    over `repeat` runs, the throughput in dates per second and the peak memory traced.
+    """
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_age_bins in n_age_bins_list:
+            for n_dates in n_dates_list:
+                filepaths = write_region_files(directory, n_regions, n_dates, n_age_bins)
+                datas = [load_covid_data(filepath) for filepath in filepaths]
+                test_series = [[entry["epidemiology"]["tested"]["new"]["all"] for entry in data["evolution"].values()]
+                               for data in datas]
+                cases = {"validate_schema": (validate_schema, [(SCHEMA_FILEPATH, f) for f in filepaths]),
+                         "load_covid_data": (load_covid_data, [(f,) for f in filepaths]),
+                         "load_covid_data_columnar": (load_covid_data, [(f, SCHEMA_FILEPATH, True, True)
+                                                                         for f in filepaths]),
+                         "cases_per_population_by_age": (cases_per_population_by_age, [(d,) for d in datas]),
+                         "hospital_vs_confirmed": (hospital_vs_confirmed, [(d,) for d in datas]),
+                         "compute_running_average": (compute_running_average, [(t, 7) for t in test_series]),
+                         "count_high_rain_low_tests_days": (count_high_rain_low_tests_days, [(d,) for d in datas]),
+                         }
+                size_mb = sum(os.path.getsize(filepath) for filepath in filepaths) / 2**20
+                for name, (function, inputs) in cases.items():
+                    run = _over_regions(function, inputs)
+                    seconds = time_call(run, repeat=repeat)
+                    records.append({"function": name,
+                                    "n_dates": n_dates,
+                                    "n_age_bins": n_age_bins,
+                                    "n_regions": n_regions,
+                                    "file_mb": size_mb,
+                                    "seconds": seconds,
+                                    "dates_per_second": n_regions * n_dates / seconds,
+                                    "peak_memory_bytes": peak_memory(run),
+                                    })
+                    print(f"{name:<32} {n_regions} x {n_dates:>6} dates, {n_age_bins:>3} age bins: "
+                          f"{seconds * 1e3:10.2f} ms, {records[-1]['dates_per_second']:12.0f} dates/s, "
+                          f"peak {records[-1]['peak_memory_bytes'] / 2**20:8.2f} MB")
+                for filepath in filepaths:
+                    os.remove(filepath)
+    return records
+
+
+def save_results(records, filepath=RESULTS_FILEPATH):
+    with open(filepath, "w") as json_file:
+        json.dump({"created": datetime.datetime.now().isoformat(timespec="seconds"),
+                   "records": records}, json_file, indent=2)
+
+
+def compare_results(records, previous_filepath, tolerance=0.1):
+    """
+    Compare `records` with the results saved in `previous_filepath`, printing the ratio of the
+    times of every matching record. Returns the records more than `tolerance` slower than before.
+    """
+    with open(previous_filepath) as json_file:
+        previous = json.load(json_file)["records"]
+
+    def record_key(record):
+        return record["function"], record["n_dates"], record["n_age_bins"], record["n_regions"]
+
+    previous = {record_key(record): record for record in previous}
+    regressions = []
+    for record in records:
+        if record_key(record) not in previous:
+            continue
+        ratio = record["seconds"] / previous[record_key(record)]["seconds"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(record)
+            flag = "  <-- slower"
+        print(f"{record['function']:<32} {record['n_dates']:>6} dates, {record['n_age_bins']:>3} age bins: "
+              f"x{ratio:.2f} the previous time{flag}")
+    return regressions
+
+
+def run_comparisons():
+    """Before/after benchmarks of the individual optimisations."""
+    bench_load()
+    bench_columnar()
+    bench_running_average()
+    bench_stream()
+    bench_batch()
+    bench_validate()
+    bench_cache()
+    bench_instrumentation()
+    bench_lazy()
+    bench_async()
+    bench_query()
+    bench_records()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of process_covid on synthetic data")
+    parser.add_argument("--dates", type=int, nargs="+", default=[100, 1000, 10000], help="numbers of dates")
+    parser.add_argument("--age-bins", type=int, nargs="+", default=[4, 20], help="numbers of age bins")
+    parser.add_argument("--regions", type=int, default=1, help="number of region files per measurement")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is kept")
+    parser.add_argument("--output", default=RESULTS_FILEPATH, help="JSON file the results are saved to")
+    parser.add_argument("--compare", help="JSON file of previous results to compare with")
+    parser.add_argument("--comparisons", action="store_true",
+                        help="run the before/after benchmarks of the individual optimisations instead")
+    args = parser.parse_args()
+    if any(not MIN_AGE_BINS <= n_age_bins <= MAX_AGE_BINS for n_age_bins in args.age_bins):
+        parser.error(f"--age-bins must be from {MIN_AGE_BINS} to {MAX_AGE_BINS}")
+
+    if args.comparisons:
+        run_comparisons()
+        return
+    records = run_suite(args.dates, args.age_bins, args.regions, args.repeat)
+    save_results(records, args.output)
+    if args.compare:
+        compare_results(records, args.compare)
+
+
+if __name__ == "__main__":
+    main()
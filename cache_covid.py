@@ -0,0 +1,98 @@
+import hashlib
+import os
+import pickle
+
+DEFAULT_CACHE_DIR = ".covid_cache"
+DEFAULT_MAX_BYTES = 2**30
+
+
+class CovidDataCache:
+    """
+    On-disk cache of parsed and validated region files, keyed by file path, mtime, size and the
+    fingerprint of the schema they were validated against (see `validate_schema.schema_fingerprint`).
+    Each entry is a pickle file holding the key followed by the data, so stale entries are
+    detected without unpickling the data. Beyond `max_bytes`, the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, filepath, columnar):
+        name = hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}_{'columnar' if columnar else 'nested'}.pickle")
+
+    @staticmethod
+    def key(filepath, columnar=False, fingerprint=None):
+        """Key of the current state of `filepath`; take it before reading the file to cache its data."""
+        stat = os.stat(filepath)
+        return os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size, columnar, fingerprint
+
+    def get(self, filepath, columnar=False, fingerprint=None, key=None):
+        """
+        Cached data for `filepath`, or None if it is missing, the file changed since,
+        or it was stored with another schema `fingerprint`.
+        key: `key` of the file, if already taken.
+        """
+        if key is None:
+            key = self.key(filepath, columnar, fingerprint)
+        entry_path = self._entry_path(filepath, columnar)
+        try:
+            with open(entry_path, "rb") as entry_file:
+                if pickle.load(entry_file) != key:
+                    return None
+                data = pickle.load(entry_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(entry_path)  # Mark as recently used
+        return data
+
+    def put(self, filepath, data, columnar=False, fingerprint=None, key=None):
+        """
+        Store `data` read from `filepath`.
+        key: `key` of the file taken before reading it, so that data read from a file rewritten in the
+             meantime is stored as stale rather than under the key of the new content.
+        """
+        if key is None:
+            key = self.key(filepath, columnar, fingerprint)
+        entry_path = self._entry_path(filepath, columnar)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as entry_file:
+            pickle.dump(key, entry_file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, entry_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pickle"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime_ns, stat.st_size, os.path.join(self.cache_dir, name)))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in `max_bytes`."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(entry_path)
+            total -= size
+
+    def invalidate(self, filepath):
+        """Drop the cached entries of `filepath`."""
+        for columnar in [False, True]:
+            entry_path = self._entry_path(filepath, columnar)
+            if os.path.exists(entry_path):
+                os.remove(entry_path)
+
+    def clear(self):
+        for _, _, entry_path in self._entries():
+            os.remove(entry_path)
@@ -0,0 +1,32 @@
+import json
+import pytest
+from process_covid import load_covid_data, SCHEMA_FILEPATH
+
+SAMPLE_FILEPATH = "covid_data/ER-Mi-EV_2020-03-16_2020-04-24.json"
+
+
+@pytest.fixture
+def sample_filepath():
+    return SAMPLE_FILEPATH
+
+
+@pytest.fixture
+def schema_filepath():
+    return SCHEMA_FILEPATH
+
+
+@pytest.fixture
+def write_region_files(tmp_path):
+    """
+    Function writing `n_files` copies of the sample file to tmp_path, as 'region_{i}.json' with the region key 'R{i}'.
+    Returns their filepaths.
+    """
+    def write(n_files):
+        data = load_covid_data(SAMPLE_FILEPATH)
+        filepaths = []
+        for i in range(n_files):
+            filepaths.append(str(tmp_path / f"region_{i}.json"))
+            with open(filepaths[-1], "w") as json_file:
+                json.dump(dict(data, region=dict(data["region"], key=f"R{i}")), json_file)
+        return filepaths
+    return write
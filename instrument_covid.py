@@ -0,0 +1,102 @@
+import json
+import time
+from contextlib import contextmanager
+
+# True while at least one listener is registered; instrumented code checks it before doing any work
+enabled = False
+_listeners = []
+
+
+def add_listener(listener):
+    """Register `listener`, called with every record (a dict) emitted while instrumentation is enabled."""
+    global enabled
+    _listeners.append(listener)
+    enabled = True
+
+
+def remove_listener(listener):
+    global enabled
+    _listeners.remove(listener)
+    enabled = len(_listeners) > 0
+
+
+def emit(record):
+    for listener in list(_listeners):
+        listener(record)
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        emit({"type": "stage", "name": self.name, "seconds": time.perf_counter() - self.start,
+              "failed": exc_type is not None})
+        return False
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_no_stage = _NoStage()
+
+
+def stage(name):
+    """Context manager timing the stage `name`; does nothing when instrumentation is disabled."""
+    return _Stage(name) if enabled else _no_stage
+
+
+def count(name, value=1):
+    """Add `value` to the counter `name`; does nothing when instrumentation is disabled."""
+    if enabled:
+        emit({"type": "counter", "name": name, "value": value})
+
+
+class Recorder:
+    """Listener keeping every record, with the totals per stage and per counter."""
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def stage_seconds(self):
+        totals = {}
+        for record in self.records:
+            if record["type"] == "stage":
+                totals[record["name"]] = totals.get(record["name"], 0) + record["seconds"]
+        return totals
+
+    def counters(self):
+        totals = {}
+        for record in self.records:
+            if record["type"] == "counter":
+                totals[record["name"]] = totals.get(record["name"], 0) + record["value"]
+        return totals
+
+    def save(self, filepath):
+        """Write the records as JSON lines."""
+        with open(filepath, "w") as records_file:
+            for record in self.records:
+                records_file.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def recording():
+    """Enable instrumentation within the block, collecting the records into the `Recorder` yielded."""
+    recorder = Recorder()
+    add_listener(recorder)
+    try:
+        yield recorder
+    finally:
+        remove_listener(recorder)
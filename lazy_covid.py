@@ -0,0 +1,295 @@
+import json
+import mmap
+import re
+from collections.abc import Mapping
+
+_whitespace = re.compile(rb"\s*")
+_string = re.compile(rb'"(?:[^"\\]|\\.)*"')
+_scalar = re.compile(rb"[^\s,\]}]+")
+_token = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+_close = re.compile(rb"[}\]]")
+_number = re.compile(rb"-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?")
+_CONSTANTS = {b"null": None, b"true": True, b"false": False}
+_NOT_BRACKETS = bytes(sorted(set(range(256)) - set(b"{}[]")))
+_NOT_BRACKETS_OR_QUOTES = bytes(sorted(set(range(256)) - set(b'{}[]"')))
+# Keys of the evolution object are dates, so they start with a digit, unlike the keys inside a date entry
+_date_key = re.compile(rb'"\d[^"\\]*"\s*:\s*\{')
+
+
+def _balanced_end(buf, pos):
+    """
+    End of the object or array starting at `pos`, taken as the first closing bracket where the brackets
+    balance, and accepted only if what it closes is exactly one value; None if the guess does not hold
+    (e.g. brackets inside strings).
+    """
+    depth = 0
+    start = pos
+    while True:
+        match = _close.search(buf, start)
+        if match is None:
+            return None
+        segment = buf[start:match.end()]
+        depth += segment.count(b"{") + segment.count(b"[") - segment.count(b"}") - segment.count(b"]")
+        start = match.end()
+        if depth <= 0:
+            return start if depth == 0 and _is_single_value(buf[pos:start]) else None
+
+
+def _skip_value(buf, pos):
+    """End of the JSON value starting at `pos`, found without decoding it."""
+    char = buf[pos:pos+1]
+    if char in (b"{", b"["):
+        end = _balanced_end(buf, pos)
+        if end is not None:
+            return end
+        depth = 0
+        for match in _token.finditer(buf, pos):
+            token = buf[match.start():match.start()+1]
+            if token == b'"':
+                continue
+            depth += 1 if token in (b"{", b"[") else -1
+            if depth == 0:
+                return match.end()
+        raise ValueError("Unterminated JSON value")
+    match = (_string if char == b'"' else _scalar).match(buf, pos)
+    if match is None:
+        raise ValueError(f"Invalid JSON value at byte {pos}")
+    return match.end()
+
+
+def _brackets(body):
+    """Brackets of `body`, starting outside any string, with the strings removed; None if it ends inside a string."""
+    # Strings holding no bracket are pairs of adjacent quotes once only quotes and brackets are kept
+    brackets = body.translate(None, _NOT_BRACKETS_OR_QUOTES).replace(b'""', b"")
+    if b'"' not in brackets and b"\\" not in body:
+        return brackets
+    if b"\\" in body:
+        body = _string.sub(b"", body)
+        if b'"' in body:
+            return None
+    else:
+        # Without escapes, the strings are exactly every other piece between two quotes
+        pieces = body.split(b'"')
+        if len(pieces) % 2 == 0:
+            return None
+        body = b"".join(pieces[0::2])
+    return body.translate(None, _NOT_BRACKETS)
+
+
+def _is_balanced(brackets):
+    """Whether `brackets` is a sequence of complete pairs: innermost pairs are removed until none is left."""
+    while brackets:
+        reduced = brackets.replace(b"{}", b"").replace(b"[]", b"")
+        if reduced == brackets:
+            return False
+        brackets = reduced
+    return True
+
+
+def _is_single_value(body):
+    """Whether `body`, starting outside any string, is exactly one object or array."""
+    brackets = _brackets(body)
+    return (brackets is not None and brackets[:1] + brackets[-1:] in (b"{}", b"[]")
+            and _is_balanced(brackets[1:-1]))
+
+
+def _entry_end(buf, start, next_key):
+    """
+    End of the date entry starting at `start`, guessed from the position of the next date key and
+    accepted only if what lies in between is exactly one object; None if the guess does not hold.
+    """
+    if next_key is None or buf[start:start+1] != b"{":
+        return None
+    body = buf[start:next_key.start()].rstrip()
+    if not body.endswith(b","):
+        return None
+    body = body[:-1].rstrip()
+    if not body.endswith(b"}") or not _is_single_value(body):
+        return None
+    return start + len(body)
+
+
+def _index_object(buf, pos, value_end=None):
+    """
+    Byte offsets {key: (start, end)} of the member values of the object starting at `pos`, with the
+    end of each value given by value_end(key, start) (by default skipped without decoding it), and the
+    end of the object.
+    """
+    if buf[pos:pos+1] != b"{":
+        raise ValueError(f"Expected a JSON object at byte {pos}")
+    offsets = {}
+    pos = _whitespace.match(buf, pos + 1).end()
+    if buf[pos:pos+1] == b"}":
+        return offsets, pos + 1
+    while True:
+        key_match = _string.match(buf, pos)
+        if key_match is None:
+            raise ValueError(f"Expected a key at byte {pos}")
+        key = json.loads(key_match.group())
+        pos = _whitespace.match(buf, key_match.end()).end()
+        if buf[pos:pos+1] != b":":
+            raise ValueError(f"Expected ':' at byte {pos}")
+        start = _whitespace.match(buf, pos + 1).end()
+        offsets[key] = (start, _skip_value(buf, start) if value_end is None else value_end(key, start))
+        pos = _whitespace.match(buf, offsets[key][1]).end()
+        char = buf[pos:pos+1]
+        if char == b"}":
+            return offsets, pos + 1
+        if char != b",":
+            raise ValueError(f"Expected ',' or '}}' at byte {pos}")
+        pos = _whitespace.match(buf, pos + 1).end()
+
+
+def index_evolution(buf, pos):
+    """
+    Byte offsets {date: (start, end)} of the date entries of the evolution object starting at `pos`,
+    and the end of the object.
+    """
+    def entry_end(date, start):
+        return _entry_end(buf, start, _date_key.search(buf, start + 1)) or _skip_value(buf, start)
+    return _index_object(buf, pos, entry_end)
+
+
+def _decode(value):
+    # json.loads, with the common scalars read directly
+    if value in _CONSTANTS:
+        return _CONSTANTS[value]
+    match = _number.fullmatch(value)
+    if match is None:
+        return json.loads(value)
+    return int(value) if match.lastindex is None else float(value)
+
+
+class LazyObject(Mapping):
+    """
+    Read-only view of the JSON object starting at byte `start` of `buf`, and ending before `bound`.
+    A member is read by searching its key in the bytes and checking that everything before it in the object
+    is complete members, so the values before it are neither decoded nor walked in Python.
+    Nested objects are returned as further lazy views, kept with the positions of their members,
+    and other values are decoded when read.
+    """
+    __slots__ = ("_buf", "_start", "_bound", "_starts", "_children", "_offsets")
+
+    def __init__(self, buf, start=0, bound=None):
+        self._buf = buf
+        self._start = start
+        self._bound = len(buf) if bound is None else bound
+        self._starts = {}  # {key: start of its value}
+        self._children = {}
+        self._offsets = None  # {key: (start, end)} of every member, in file order, once iterated
+
+    def _find(self, key):
+        """Start of the value of `key`, or None if the object has no such member."""
+        buf, start = self._buf, self._start
+        if key.isascii() and key.isprintable() and '"' not in key and "\\" not in key:
+            needle = f'"{key}"'.encode()
+            pos = buf.find(needle, start, self._bound)
+            while pos >= 0:
+                colon = _whitespace.match(buf, pos + len(needle)).end()
+                if buf[colon:colon+1] == b":":
+                    # A key of this object, rather than of a nested one, if all before it is complete members
+                    brackets = _brackets(buf[start+1:pos])
+                    if brackets is not None and _is_balanced(brackets):
+                        return _whitespace.match(buf, colon + 1).end()
+                pos = buf.find(needle, pos + 1, self._bound)
+            if buf.find(b"\\", start, self._bound) < 0:
+                return None
+        # The key may be escaped in the file: walk the members
+        if self._offsets is None:
+            self._offsets = _index_object(buf, start)[0]
+        return self._offsets[key][0] if key in self._offsets else None
+
+    def __getitem__(self, key):
+        if key in self._children:
+            return self._children[key]
+        if key not in self._starts:
+            self._starts[key] = self._find(key)
+        start = self._starts[key]
+        if start is None:
+            raise KeyError(key)
+        if self._buf[start:start+1] == b"{":
+            self._children[key] = LazyObject(self._buf, start, self._bound)
+            return self._children[key]
+        return _decode(self._buf[start:_skip_value(self._buf, start)])
+
+    def __iter__(self):
+        if self._offsets is None:
+            self._offsets = _index_object(self._buf, self._start)[0]
+        return iter(self._offsets)
+
+    def __len__(self):
+        if self._offsets is None:
+            self._offsets = _index_object(self._buf, self._start)[0]
+        return len(self._offsets)
+
+
+class LazyEvolution(Mapping):
+    """
+    The evolution object as {date: LazyObject}, read from the file in place. The view of each entry
+    is kept once read, so the offsets of its members are found only once.
+    """
+
+    def __init__(self, buf, offsets):
+        self._buf = buf
+        self.offsets = offsets
+        self._entries = {}
+
+    def __getitem__(self, date):
+        if date not in self._entries:
+            self._entries[date] = LazyObject(self._buf, *self.offsets[date])
+        return self._entries[date]
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+class LazyCovidData(Mapping):
+    """
+    Lazy, read-only view of a region file that the analysis functions of process_covid accept in place
+    of the loaded document. Opening it indexes the byte offsets of the top-level entries and of every
+    date entry; only the fields actually read are then decoded.
+    The file is not validated against the schema.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, "rb") as json_file:
+            self._buf = mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._values = {}
+        self.evolution_offsets = {}
+
+        def value_end(key, start):
+            if key == "evolution" and self._buf[start:start+1] == b"{":
+                self.evolution_offsets, end = index_evolution(self._buf, start)
+                return end
+            return _skip_value(self._buf, start)
+
+        self.offsets, _ = _index_object(self._buf, _whitespace.match(self._buf, 0).end(), value_end)
+
+    def __getitem__(self, key):
+        if key == "evolution" and key in self.offsets:
+            if "evolution" not in self._values:
+                self._values["evolution"] = LazyEvolution(self._buf, self.evolution_offsets)
+            return self._values["evolution"]
+        if key not in self._values:
+            start, end = self.offsets[key]
+            self._values[key] = json.loads(self._buf[start:end])
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        self._buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
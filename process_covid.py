@@ -1,6 +1,18 @@
 import json
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping, Sequence
+from functools import lru_cache
+from itertools import accumulate, islice
+from operator import le, sub
 import matplotlib.pyplot as plt
-from validate_schema import validate_schema
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import instrument_covid
+from validate_schema import find_schema_error, format_path, schema_fingerprint
+
+SCHEMA_FILEPATH = "covid_data/schema.json"
 
 
 def merge_age_binning(age_binning1, age_binning2):
@@ -32,6 +44,7 @@ def merge_age_binning(age_binning1, age_binning2):
 def sum_sublists(l, indices):
     if max(indices) >= len(l):
         raise ValueError("'indices' contains elements greater than the size of 'l'")
+    indices = set(indices)
     result = []
     subsum = 0
     for i in range(len(l)):
@@ -46,6 +59,7 @@ def get_new_age_binning(init_age_binning, indices):
     if max(indices) >= len(init_age_binning):
         raise ValueError("'indices' contains elements greater than the size of 'l'")
 
+    indices = set(indices)
     cur_min = 0
     result = []
     change_cur_min = False
@@ -60,15 +74,274 @@ def get_new_age_binning(init_age_binning, indices):
     return result
 
 
-def load_covid_data(filepath):
-    if not validate_schema("covid_data/schema.json", filepath):
-        raise ValueError(f"Incorrect schema given in {filepath}")
-    with open(filepath) as json_file:
-        data = json.load(json_file)
+def _flatten_entry(entry, prefix=""):
+    for key, value in entry.items():
+        if isinstance(value, Mapping):
+            yield from _flatten_entry(value, f"{prefix}{key}/")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def to_columnar(input_data):
+    """
+    Convert the "evolution" block into a columnar store.
+    The result keeps every other top-level entry, and replaces "evolution" by:
+      'dates': the shared date axis, in file order
+      'columns': one list per metric path (e.g. 'epidemiology/confirmed/total/age'),
+                 aligned with 'dates', with None where the value is missing.
+    """
+    dates = list(input_data["evolution"].keys())
+    columns = {}
+    for idx_date, date in enumerate(dates):
+        for path, value in _flatten_entry(input_data["evolution"][date]):
+            if path not in columns:
+                columns[path] = [None] * len(dates)
+            columns[path][idx_date] = value
+
+    columnar_data = {key: value for key, value in input_data.items() if key != "evolution"}
+    columnar_data["dates"] = dates
+    columnar_data["columns"] = columns
+    return columnar_data
+
+
+class SeriesView(Sequence):
+    """
+    Read-only view of `values[start:stop]` sharing the storage of `values`.
+    Slicing a view gives another view, so narrowing a range never copies the values.
+    """
+    __slots__ = ("_values", "_start", "_stop")
+
+    def __init__(self, values, start=0, stop=None):
+        self._values = values
+        self._start, stop, _ = slice(start, stop).indices(len(values))
+        self._stop = max(stop, self._start)
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step == 1:
+                return SeriesView(self._values, self._start + start, self._start + max(stop, start))
+            return [self._values[self._start + i] for i in range(start, stop, step)]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("SeriesView index out of range")
+        return self._values[self._start + idx]
+
+    def __iter__(self):
+        return map(self._values.__getitem__, range(self._start, self._stop))
+
+    def __eq__(self, other):
+        if isinstance(other, (SeriesView, list, tuple, array)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"SeriesView({list(self)!r})"
+
+
+def _is_sorted(values):
+    return all(map(le, values, islice(values, 1, None)))
+
+
+def _date_rows(dates, start_date=None, stop_date=None):
+    start = 0 if start_date is None else bisect_left(dates, start_date)
+    stop = len(dates) if stop_date is None else bisect_right(dates, stop_date)
+    return start, max(start, stop)
+
+
+class CovidQuery(dict):
+    """
+    Columnar store (see `to_columnar`) indexed by date, for date-range and metric queries.
+    The analysis functions accept it like any columnar store. Its rows are sorted by date, comparing
+    dates as strings (i.e. ISO dates), so that a range of dates is a range of rows:
+      rows: {date: row position}
+      select(metric, start_date, stop_date): values of a metric path over a range of dates, without copying
+    Build it once and reuse it for repeated queries on the same region.
+    """
+
+    def __init__(self, input_data):
+        columnar_data = input_data if "columns" in input_data else to_columnar(input_data)
+        super().__init__(columnar_data)
+        dates = columnar_data["dates"]
+        if not _is_sorted(dates):
+            order = sorted(range(len(dates)), key=dates.__getitem__)
+            self["dates"] = [dates[idx] for idx in order]
+            self["columns"] = {path: [column[idx] for idx in order]
+                               for path, column in columnar_data["columns"].items()}
+        self.rows = {date: row for row, date in enumerate(self["dates"])}
+
+    def row_range(self, start_date=None, stop_date=None):
+        """Rows (start, stop) of the dates from `start_date` to `stop_date`, both included; None leaves it open."""
+        return _date_rows(self["dates"], start_date, stop_date)
+
+    def select_dates(self, start_date=None, stop_date=None):
+        return SeriesView(self["dates"], *self.row_range(start_date, stop_date))
+
+    def select(self, metric, start_date=None, stop_date=None):
+        if metric not in self["columns"]:
+            raise KeyError(f"Unknown metric '{metric}'")
+        return SeriesView(self["columns"][metric], *self.row_range(start_date, stop_date))
+
+
+class _ColumnsWindow(Mapping):
+    """Columns of a columnar store, each read as a view of its rows `start` to `stop`."""
+
+    def __init__(self, columns, start, stop):
+        self._columns = columns
+        self._start, self._stop = start, stop
+
+    def __getitem__(self, path):
+        return SeriesView(self._columns[path], self._start, self._stop)
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+
+def _in_range(date, start_date, stop_date):
+    return (start_date is None or date >= start_date) and (stop_date is None or date <= stop_date)
+
+
+def _date_window(input_data, start_date=None, stop_date=None):
+    """
+    `input_data` narrowed to the dates from `start_date` to `stop_date`, so an analysis resolves its range once
+    and reads every series of the window without a date range. The rows of a columnar store are bisected
+    in place when its dates are sorted; only unsorted stores are reordered into a CovidQuery.
+    """
+    if start_date is None and stop_date is None:
+        return input_data
+    if "columns" not in input_data:
+        return dict(input_data, evolution={date: date_entry for date, date_entry in input_data["evolution"].items()
+                                           if _in_range(date, start_date, stop_date)})
+    if not isinstance(input_data, CovidQuery) and not _is_sorted(input_data["dates"]):
+        input_data = CovidQuery(input_data)
+    start, stop = _date_rows(input_data["dates"], start_date, stop_date)
+    return dict(input_data, dates=SeriesView(input_data["dates"], start, stop),
+                columns=_ColumnsWindow(input_data["columns"], start, stop))
+
+
+def get_dates(input_data, start_date=None, stop_date=None):
+    """Dates of the region, only those from `start_date` to `stop_date` (both included) if given."""
+    input_data = _date_window(input_data, start_date, stop_date)
+    if "columns" in input_data:
+        return input_data["dates"]
+    return list(input_data["evolution"].keys())
+
+
+def get_multiple_series(input_data, paths, start_date=None, stop_date=None):
+    """
+    Values of the metrics at each of `paths` (e.g. 'weather/rainfall') for every date of `get_dates`,
+    from either the nested or the columnar representation. Nested data is walked once for all paths.
+    """
+    input_data = _date_window(input_data, start_date, stop_date)
+    if "columns" in input_data:
+        return {path: input_data["columns"][path] for path in paths}
+    date_entries = input_data["evolution"].values()
+    split_paths = [(path, path.split("/")) for path in paths]
+    series = {path: [] for path in paths}
+    for date_entry in date_entries:
+        for path, keys in split_paths:
+            entry = date_entry
+            for key in keys:
+                entry = entry[key]
+            series[path].append(entry)
+    return series
+
+
+def get_series(input_data, path, start_date=None, stop_date=None):
+    return get_multiple_series(input_data, [path], start_date, stop_date)[path]
+
+
+class RebinningPlan:
+    """
+    Precomputed rebinning of two age binnings onto the binning they have in common.
+    age_binning: labels of the common binning
+    bounds: for each of the two input binnings, the (start, stop) slice of bins summed into each common bin
+    Use `get_rebinning_plan` to share plans between calls; plans are shared, so they must not be modified.
+    """
+
+    def __init__(self, age_binning1, age_binning2):
+        list_id1, list_id2 = merge_age_binning(age_binning1, age_binning2)
+        self.age_binning = tuple(get_new_age_binning(age_binning1, list_id1))
+        self.sizes = (len(age_binning1), len(age_binning2))
+        self.bounds = tuple(tuple(zip([0] + [i + 1 for i in list_id[:-1]], [i + 1 for i in list_id]))
+                            for list_id in (list_id1, list_id2))
+
+    def rebin(self, values, binning=0):
+        """Sum `values`, given in the first (binning=0) or second (binning=1) input binning, into the common bins."""
+        return self.rebin_matrix([values], binning)[0]
+
+    def rebin_matrix(self, matrix, binning=0):
+        """Rebin every row of a date x age matrix."""
+        size, bounds = self.sizes[binning], self.bounds[binning]
+        if any(len(row) != size for row in matrix):
+            raise ValueError(f"Every row should have {size} age bins to be rebinned")
+        return [[sum(row[start:stop]) for start, stop in bounds] for row in matrix]
+
+
+@lru_cache(maxsize=128)
+def _get_rebinning_plan(age_binning1, age_binning2):
+    return RebinningPlan(age_binning1, age_binning2)
+
+
+def get_rebinning_plan(age_binning1, age_binning2):
+    return _get_rebinning_plan(tuple(age_binning1), tuple(age_binning2))
+
+
+def parse_covid_data(content, filepath="<data>", schema=SCHEMA_FILEPATH, validate=True, columnar=False):
+    """
+    Parse and validate the content (bytes or str) of a region file, as `load_covid_data` does once
+    the file is read. `filepath` is only used in the error message.
+    """
+    with instrument_covid.stage("parse"):
+        data = json.loads(content)
+    if instrument_covid.enabled:
+        instrument_covid.count("bytes_parsed", len(content.encode() if isinstance(content, str) else content))
+        if isinstance(data, dict) and isinstance(data.get("evolution"), dict):
+            instrument_covid.count("dates_loaded", len(data["evolution"]))
+    if validate:
+        error = find_schema_error(schema, data)
+        if error is not None:
+            raise ValueError(f"Incorrect schema given in {filepath} at {format_path(error)}")
+    if columnar:
+        with instrument_covid.stage("columnar"):
+            data = to_columnar(data)
+    return data
+
+
+def load_covid_data(filepath, schema=SCHEMA_FILEPATH, validate=True, columnar=False, cache=None):
+    """
+    Parse the region file once and validate the parsed object in memory.
+    schema: path to the schema (compiled once per process), an already loaded schema dict or a SchemaValidator.
+    validate: set to False to skip the schema check for trusted files.
+    columnar: return the columnar store built by `to_columnar` instead of the nested dict.
+    cache: optional `cache_covid.CovidDataCache`; warm loads skip parsing and validation,
+           and only validated data is stored in it, keyed by the fingerprint of `schema`.
+    """
+    if cache is not None:
+        with instrument_covid.stage("cache_lookup"):
+            # Taken before reading, so the data is never stored under the key of a later version of the file
+            key = cache.key(filepath, columnar, schema_fingerprint(schema))
+            data = cache.get(filepath, columnar, key=key)
+        if data is not None:
+            return data
+
+    with open(filepath, "rb") as json_file:
+        content = json_file.read()
+    data = parse_covid_data(content, filepath, schema, validate, columnar)
+    if cache is not None and validate:
+        with instrument_covid.stage("cache_store"):
+            cache.put(filepath, data, columnar, key=key)
     return data
 
 
-def cases_per_population_by_age(input_data):
+def cases_per_population_by_age(input_data, start_date=None, stop_date=None):
     total_population = input_data["region"]["population"]["age"]
     if None in total_population:
         raise ValueError("Missing data at 'region'->'population'->'age'")
@@ -79,38 +352,144 @@ def cases_per_population_by_age(input_data):
     if len(age_binning_cases) == 0:
         raise ValueError("Age binning not provided for the hospitalizations")
 
-    list_id1, list_id2 = merge_age_binning(age_binning_population, age_binning_cases)
-    new_total_population = sum_sublists(total_population, list_id1)
-    new_age_binning = get_new_age_binning(age_binning_population, list_id1)
+    plan = get_rebinning_plan(age_binning_population, age_binning_cases)
+    new_total_population = plan.rebin(total_population, 0)
 
-    result = {new_age_binning[i]: [] for i in range(len(new_age_binning))}
-    for date in input_data["evolution"].keys():
-        total_cases = input_data["evolution"][date]["epidemiology"]["confirmed"]["total"]["age"]
-        if None in total_cases:
+    input_data = _date_window(input_data, start_date, stop_date)
+    dates = get_dates(input_data)
+    total_cases = get_series(input_data, "epidemiology/confirmed/total/age")
+    for date, cases in zip(dates, total_cases):
+        if None in cases:
             raise ValueError(f"Missing data at 'evolution'->{date}->'epidemiology'->'confirmed'->'total'->'age'")
-
-        new_total_cases = sum_sublists(total_cases, list_id2)
-
-        for idx_age in range(len(new_total_cases)):
-            percentage = new_total_cases[idx_age] / new_total_population[idx_age]
-            result[new_age_binning[idx_age]].append((date, percentage))
+    with instrument_covid.stage("rebin"):
+        new_total_cases = plan.rebin_matrix(total_cases, 1)
+    instrument_covid.count("dates_processed", len(dates))
+
+    result = {}
+    for idx_age, age_bin in enumerate(plan.age_binning):
+        result[age_bin] = [(date, cases[idx_age] / new_total_population[idx_age])
+                           for date, cases in zip(dates, new_total_cases)]
     return result
 
 
-def hospital_vs_confirmed(input_data):
+def hospital_vs_confirmed(input_data, start_date=None, stop_date=None):
     list_percentage_hosp = []
     list_dates = []
-    for date in input_data["evolution"].keys():
-        n_hospitalized = input_data["evolution"][date]["hospitalizations"]["hospitalized"]["new"]["all"]
-        n_cases = input_data["evolution"][date]["epidemiology"]["confirmed"]["new"]["all"]
+    input_data = _date_window(input_data, start_date, stop_date)
+    dates = get_dates(input_data)
+    hospitalized = get_series(input_data, "hospitalizations/hospitalized/new/all")
+    cases = get_series(input_data, "epidemiology/confirmed/new/all")
+    for date, n_hospitalized, n_cases in zip(dates, hospitalized, cases):
         if n_hospitalized is None or n_cases is None:
             continue
         list_percentage_hosp.append(n_hospitalized / n_cases)
         list_dates.append(date)
 
+    if instrument_covid.enabled:
+        instrument_covid.count("dates_processed", len(dates))
+        instrument_covid.count("missing_values_skipped", len(dates) - len(list_dates))
     return list_dates, list_percentage_hosp
 
 
+LINESTYLE = {"total": "-", "new": "--"}
+SEX_COLOR = {'male': "green",
+             'female': "purple"}
+AGE_COLOR = {'25': "green",
+             '50': "orange",
+             '75': "purple",
+             '20000': "pink"}
+
+
+def _age_cutoff(age_binning, max_age):
+    """Index of the last bin included below `max_age`, the actual max age of that bin and its colour."""
+    if not isinstance(max_age, int):
+        raise ValueError(f"'max_age' should be an integer, not {max_age} of type {type(max_age)}")
+    min_ages_available = [int(age_range.split("-")[0]) for age_range in age_binning]
+
+    # Decide the actual maximum age based on the bins
+    selected_age_idx = 0
+    for idx_age, age in enumerate(min_ages_available):
+        if max_age >= age:
+            selected_age_idx = idx_age
+    if selected_age_idx == len(age_binning) - 1:
+        actual_max_age = "200"
+    else:
+        actual_max_age = age_binning[selected_age_idx].split("-")[1]
+
+    # Decide the color based on the actual max age
+    selected_age = 0
+    for age in AGE_COLOR.keys():
+        if int(actual_max_age) <= int(age):
+            selected_age = age
+            break
+    return selected_age_idx, actual_max_age, AGE_COLOR[selected_age]
+
+
+def generate_data_plots_confirmed(input_data, sexes=(), max_ages=(), statuses=("total",), start_date=None,
+                                  stop_date=None):
+    """
+    Data to plot for several series in a single pass over the dates (from `start_date` to `stop_date` if given).
+    Returns, for each status, one data_plot per sex in `sexes` followed by one per age in `max_ages`,
+    each the same as what `generate_data_plot_confirmed` returns for it.
+    The age series are read from a prefix sum over the age bins of each date.
+    """
+    for status in statuses:
+        if status not in {'new', 'total'}:
+            raise ValueError(f"Status must be either 'new' or 'total', not {status}")
+    for sex in sexes:
+        if sex not in ["male", "female"]:
+            raise ValueError(f"'sex' must be either 'male' or 'female', not {sex}")
+    cutoffs = []
+    if len(max_ages) > 0:
+        age_binning = input_data["metadata"]["age_binning"]["hospitalizations"]
+        cutoffs = [_age_cutoff(age_binning, max_age) for max_age in max_ages]
+
+    input_data = _date_window(input_data, start_date, stop_date)
+    dates = get_dates(input_data)
+    instrument_covid.count("dates_processed", len(dates))
+    sex_paths = {(status, sex): f"epidemiology/confirmed/{status}/{sex}" for status in statuses for sex in sexes}
+    age_paths = {status: f"epidemiology/confirmed/{status}/age" for status in statuses} if cutoffs else {}
+    series = get_multiple_series(input_data, list(sex_paths.values()) + list(age_paths.values()))
+
+    sex_values = {key: [] for key in sex_paths}
+    age_values = {status: [[] for _ in cutoffs] for status in age_paths}
+    n_bins = max([idx_age for idx_age, _, _ in cutoffs], default=-1) + 1
+    for idx_date, date in enumerate(dates):
+        for (status, sex), path in sex_paths.items():
+            n_conf_cases = series[path][idx_date]
+            if n_conf_cases is None:
+                raise ValueError(f"Missing data at 'evolution'->'{date}'->'epidemiology'->'confirmed'->'{status}'->'{sex}'")
+            sex_values[status, sex].append(n_conf_cases)
+        for status, path in age_paths.items():
+            n_conf_cases_age = series[path][idx_date][:n_bins]
+            n_valid_bins = n_conf_cases_age.index(None) if None in n_conf_cases_age else len(n_conf_cases_age)
+            cum_conf_cases = list(accumulate(n_conf_cases_age[:n_valid_bins]))
+            for values, (idx_age, _, _) in zip(age_values[status], cutoffs):
+                if idx_age >= n_valid_bins:
+                    raise ValueError(f"Missing data at 'evolution'->'{date}'->'epidemiology'->'confirmed'->'{status}'->'age'")
+                values.append(cum_conf_cases[idx_age])
+
+    data_plots = []
+    for status in statuses:
+        for sex in sexes:
+            data_plots.append({'date': list(dates),
+                               'value': sex_values[status, sex],
+                               'color': SEX_COLOR[sex],
+                               'linestyle': LINESTYLE[status],
+                               'actual_max_age': None,
+                               'label': f"{status} {sex}",
+                               })
+        for values, (_, actual_max_age, color) in zip(age_values.get(status, []), cutoffs):
+            data_plots.append({'date': list(dates),
+                               'value': values,
+                               'color': color,
+                               'linestyle': LINESTYLE[status],
+                               'actual_max_age': actual_max_age,
+                               'label': f"{status} younger than {actual_max_age}",
+                               })
+    return data_plots
+
+
 def generate_data_plot_confirmed(input_data, sex, max_age, status):
     """
     At most one of sex or max_age allowed at a time.
@@ -118,152 +497,142 @@ def generate_data_plot_confirmed(input_data, sex, max_age, status):
     max_age: sums all bins below this value, including the one it is in.
     status: 'new' or 'total' (default: 'total')
     """
-
-    # if sex is not None and max_age is not None:
-    #     raise ValueError("'sex' and 'max_age' cannot be specified at the same time")
-    # if not sex and not max_age:
-    #     raise ValueError("Either sex or max_ages should be specified")
-
-    linestyle = {"total": "-", "new": "--"}
-    sex_color = {'male': "green",
-                 'female': "purple"}
-    age_color = {'25': "green",
-                 '50': "orange",
-                 '75': "purple",
-                 '20000': "pink"}
-
     if status not in {'new', 'total'}:
         raise ValueError(f"Status must be either 'new' or 'total', not {status}")
 
-    data_plot = {'date': list(input_data["evolution"].keys()),
-                 'value': [],
-                 'color': None,
-                 'linestyle': linestyle[status],
-                 'actual_max_age': None,
-                 'label': None,
-                 }
-
     if sex is not None and sex is not False:
         if sex not in ["male", "female"]:
             raise ValueError(f"'sex' must be either 'male' or 'female', not {sex}")
         if max_age is not None:
             raise ValueError(f"Both 'sex' and 'max_age' are specified, but at least one of them should be None")
-        data_plot['color'] = sex_color[sex]
-        data_plot['label'] = f"{status} {sex}"
-        for date in data_plot['date']:
-            n_conf_cases = input_data["evolution"][date]["epidemiology"]["confirmed"][status][sex]
-            if n_conf_cases is None:
-                raise ValueError(f"Missing data at 'evolution'->'{date}'->'epidemiology'->'confirmed'->'{status}'->'{sex}'")
-            data_plot['value'].append(n_conf_cases)
-
-        return data_plot
+        return generate_data_plots_confirmed(input_data, sexes=[sex], statuses=[status])[0]
     else:
         if not isinstance(max_age, int):
             raise ValueError(f"'max_age' should be an integer, not {max_age} of type {type(max_age)}")
-        age_binning = input_data["metadata"]["age_binning"]["hospitalizations"]
-        min_ages_available = [int(age_range.split("-")[0]) for age_range in age_binning]
-
-        # Decide the actual maximum age based on the bins
-        selected_age_idx = 0
-        for idx_age, age in enumerate(min_ages_available):
-            if max_age >= age:
-                selected_age_idx = idx_age
-        if selected_age_idx == len(age_binning) - 1:
-            data_plot['actual_max_age'] = "200"
-        else:
-            data_plot['actual_max_age'] = age_binning[selected_age_idx].split("-")[1]
-
-        data_plot['label'] = f"{status} younger than {data_plot['actual_max_age']}"
-
-        # Decide the color based on the actual max age
-        selected_age = 0
-        for age in age_color.keys():
-            if int(data_plot['actual_max_age']) <= int(age):
-                selected_age = age
-                break
-        data_plot['color'] = age_color[selected_age]
-
-        for date in data_plot['date']:
-            n_conf_cases = sum(
-                [input_data["evolution"][date]["epidemiology"]["confirmed"][status]["age"][idx_age]
-                 for idx_age in range(selected_age_idx+1)]
-            )
-            if n_conf_cases is None:
-                raise ValueError(f"Missing data at 'evolution'->'{date}'->'epidemiology'->'confirmed'->'{status}'->'age'")
-            data_plot['value'].append(n_conf_cases)
-
-        return data_plot
+        return generate_data_plots_confirmed(input_data, max_ages=[max_age], statuses=[status])[0]
 
 
-def create_confirmed_plot(input_data, sex=False, max_ages=[], status="total", save=False):
+def _confirmed_data_plots(input_data, sex, max_ages, status):
     if sex and len(max_ages) > 0:
         raise ValueError("'sex' and 'max_ages' cannot be specified at the same time")
     if not sex and len(max_ages) == 0:
         raise ValueError("Either sex or max_ages should be specified")
 
-    fig = plt.figure(figsize=(10, 10))
-
-    data_plots = []
     if sex:
-        type_plot = "sex"
-        for sex_type in ['male', 'female']:
-            data_plots.append(generate_data_plot_confirmed(input_data, sex_type, None, status))
-    else:
-        type_plot = "age"
-        for age in max_ages:
-            data_plots.append(generate_data_plot_confirmed(input_data, None, age, status))
+        return "sex", generate_data_plots_confirmed(input_data, sexes=['male', 'female'], statuses=[status])
+    return "age", generate_data_plots_confirmed(input_data, max_ages=max_ages, statuses=[status])
+
 
+def _draw_confirmed_plot(fig, ax, data_plots, region_name):
     fig.autofmt_xdate()  # To show dates nicely
 
     for dp in data_plots:
-        plt.plot('date', 'value', data=dp, linestyle=dp['linestyle'], label=dp['label'], color=dp['color'])
+        ax.plot('date', 'value', data=dp, linestyle=dp['linestyle'], label=dp['label'], color=dp['color'])
 
-    region_name = input_data['region']['name']
-    plt.title(f"Confirmed cases in {region_name}")
-    plt.xlabel("Date")
-    plt.ylabel("# Cases")
-    plt.legend()
+    ax.set_title(f"Confirmed cases in {region_name}")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("# Cases")
+    ax.legend()
 
-    if save:
-        plt.savefig(f"{region_name}_evolution_cases_{type_plot}.png")
-    else:
+
+def create_confirmed_plot(input_data, sex=False, max_ages=[], status="total", save=False):
+    type_plot, data_plots = _confirmed_data_plots(input_data, sex, max_ages, status)
+
+    with instrument_covid.stage("plot"):
+        fig = plt.figure(figsize=(10, 10))
+        region_name = input_data['region']['name']
+        _draw_confirmed_plot(fig, fig.gca(), data_plots, region_name)
+
+        if save:
+            plt.savefig(f"{region_name}_evolution_cases_{type_plot}.png")
+            plt.close(fig)
+    if not save:
         plt.show()
 
 
+def render_confirmed_plot(input_data, sex=False, max_ages=[], status="total", output_dir=".", fmt="png",
+                          figure=None, name=None):
+    """
+    Same plot as `create_confirmed_plot`, rendered headless with the Agg canvas instead of pyplot,
+    so no figure is left open. Saved as '{output_dir}/{name}_evolution_cases_{type}.{fmt}'.
+    figure: optional Figure to clear and reuse, e.g. when rendering many regions in a loop.
+    name: stem of the file name, the region name by default.
+    Returns the path of the saved file.
+    """
+    type_plot, data_plots = _confirmed_data_plots(input_data, sex, max_ages, status)
+
+    with instrument_covid.stage("plot"):
+        if figure is None:
+            figure = Figure(figsize=(10, 10))
+        else:
+            figure.clear()
+        FigureCanvasAgg(figure)
+        region_name = input_data['region']['name']
+        _draw_confirmed_plot(figure, figure.add_subplot(), data_plots, region_name)
+
+        if name is None:
+            name = region_name
+        filepath = os.path.join(output_dir, f"{name}_evolution_cases_{type_plot}.{fmt}")
+        figure.savefig(filepath, format=fmt)
+    return filepath
+
+
+def _is_2d(data):
+    return len(data) > 0 and isinstance(data[0], (list, tuple, array, SeriesView))
+
+
+def _sum_window(values):
+    sum_window = 0
+    for value in values:
+        if value is not None:
+            sum_window += value
+    return sum_window
+
+
 def compute_running_average(data, window):
+    """
+    Centred running average over an odd `window`, ignoring None values.
+    data: a list (or array) of numbers, or a list of such series to smooth them all in one call.
+    When every value is an int, each window sum is the difference of two prefix sums, so the cost is
+    O(len(data)) for any window. Otherwise each window is summed from left to right as before, since
+    prefix sums of floats would lose precision along the series.
+    """
     if window % 2 == 0:
         raise ValueError("'window' should be an odd integer")
-    result = []
-    shift = int((window - 1) / 2)
-    for i in range(len(data)):
-        if i < shift or i >= len(data) - shift:
-            result.append(None)
-        else:
-            sum_window, n_values = 0, 0
-            for j in range(i-shift, i+shift+1):
-                if data[j] is not None:
-                    sum_window += data[j]
-                    n_values += 1
-            avg = None if n_values == 0 else sum_window / n_values
-            result.append(avg)
+    if _is_2d(data):
+        return [compute_running_average(series, window) for series in data]
+
+    n = len(data)
+    if n < window:
+        return [None] * n
+    shift = (window - 1) // 2
+    cum_count = [0, *accumulate(x is not None for x in data)]
+    window_counts = map(sub, cum_count[window:], cum_count[:n+1-window])
+    if all(type(x) is int for x in data if x is not None):
+        cum_sum = [0, *accumulate(0 if x is None else x for x in data)]
+        window_sums = map(sub, cum_sum[window:], cum_sum[:n+1-window])
+    else:
+        window_sums = map(_sum_window, (data[start:start+window] for start in range(n + 1 - window)))
+    averages = [None if n_values == 0 else sum_window / n_values
+                for sum_window, n_values in zip(window_sums, window_counts)]
+    instrument_covid.count("missing_values_skipped", n - cum_count[-1])
 
-    return result
+    return [None] * shift + averages + [None] * shift
 
 
 def simple_derivative(data):
-    result = [None]
-    for i in range(1, len(data)):
-        if data[i] is None or data[i-1] is None:
-            result.append(None)
-        else:
-            result.append(data[i] - data[i-1])
-    return result
-
-
-def count_high_rain_low_tests_days(input_data):
-    list_dates = input_data["evolution"].keys()
-    rain_data = [input_data["evolution"][date]["weather"]["rainfall"] for date in list_dates]
-    test_data = [input_data["evolution"][date]["epidemiology"]["tested"]["new"]["all"] for date in list_dates]
+    if _is_2d(data):
+        return [simple_derivative(series) for series in data]
+    return [None] + [None if previous is None or current is None else current - previous
+                     for previous, current in zip(data, data[1:])]
+
+
+def count_high_rain_low_tests_days(input_data, start_date=None, stop_date=None):
+    input_data = _date_window(input_data, start_date, stop_date)
+    list_dates = get_dates(input_data)
+    instrument_covid.count("dates_processed", len(list_dates))
+    rain_data = get_series(input_data, "weather/rainfall")
+    test_data = get_series(input_data, "epidemiology/tested/new/all")
     smooth_test_data = compute_running_average(test_data, 7)
     deriv_rain_data = simple_derivative(rain_data)
     deriv_test_data = simple_derivative(smooth_test_data)
@@ -0,0 +1,288 @@
+import copy
+import difflib
+import re
+from array import array
+from collections.abc import Mapping
+
+from process_covid import SCHEMA_FILEPATH
+from stream_covid import iter_evolution
+from validate_schema import load_schema, SchemaValidator
+
+_IDEM = re.compile(r"<idem\s+([^>]+?)\s*>")
+_INT_MIN, _INT_MAX = -2**63, 2**63 - 1
+_ANY_KEYS = "<various_parameters>"
+
+
+def _find_node(node, keys):
+    for key in keys:
+        if not isinstance(node, dict):
+            return None
+        # The schema misspells some of the names it refers to, e.g. 'hosipitalizations'
+        matches = [key] if key in node else difflib.get_close_matches(key, list(node), n=1)
+        if not matches:
+            return None
+        node = node[matches[0]]
+    return node
+
+
+def resolve_schema(schema, _ancestors=()):
+    """
+    Copy of `schema` with each "<idem path>" leaf replaced by the node it refers to, looked up from the
+    innermost enclosing node outwards, e.g. "total": "<idem new>" by a copy of its sibling "new".
+    """
+    resolved = dict(schema)
+    ancestors = list(_ancestors) + [resolved]
+    for key, value in schema.items():
+        if isinstance(value, dict):
+            resolved[key] = resolve_schema(value, ancestors)
+        elif isinstance(value, str) and _IDEM.search(value):
+            keys = _IDEM.search(value).group(1).split("/")
+            targets = [_find_node(ancestor, keys) for ancestor in reversed(ancestors)]
+            targets = [target for target in targets if isinstance(target, dict)]
+            if not targets:
+                raise ValueError(f"Cannot resolve '{value}' at '{key}' in the schema")
+            resolved[key] = copy.deepcopy(targets[0])
+    return resolved
+
+
+def _slot_name(key, idx):
+    name = key.replace("-", "_")
+    return name if name.isidentifier() else f"_{idx}"
+
+
+class Record(Mapping):
+    """
+    Base of the classes made by `record_class`: a read-only mapping from the keys of a schema node
+    to the slots holding their values. Lists of integers are kept in arrays.
+    """
+    __slots__ = ()
+    _slots = {}  # {schema key: slot name}
+    _kinds = {}  # {schema key: nested Record class, or the schema type of the leaf}
+
+    def __init__(self, data):
+        for key, slot in self._slots.items():
+            value = data[key]
+            kind = self._kinds[key]
+            if isinstance(kind, type):
+                value = kind(value)
+            elif kind == "[Integer]" and all(type(x) is int and _INT_MIN <= x <= _INT_MAX for x in value):
+                value = array('q', value)
+            elif isinstance(value, list):
+                value = tuple(value)
+            setattr(self, slot, value)
+
+    def __getitem__(self, key):
+        if key not in self._slots:
+            raise KeyError(key)
+        return getattr(self, self._slots[key])
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+def record_class(name, schema_node):
+    """
+    `Record` subclass with one slot per key of `schema_node`, and a nested class per sub-node,
+    e.g. record_class("Region", schema["region"]) gives RegionRecord, whose "population" is a PopulationRecord.
+    """
+    slots, kinds = {}, {}
+    for idx, (key, value) in enumerate(schema_node.items()):
+        slots[key] = _slot_name(key, idx)
+        if isinstance(value, dict):
+            child_name = "".join(part.capitalize() for part in re.split(r"[-_ ]", key))
+            kinds[key] = record_class(child_name, value)
+        else:
+            kinds[key] = value
+    return type(f"{name}Record", (Record,), {"__slots__": tuple(slots.values()), "_slots": slots, "_kinds": kinds,
+                                             "__module__": __name__})
+
+
+# Codes of how each leaf of a daily entry is stored; an int code is the length of a list of integers
+_NONE, _INT, _FLOAT, _OTHER = "n", "i", "f", "o"
+
+
+def _entry_fields(schema_node):
+    """[(key, fields of the sub-node, or None for a leaf)], or _ANY_KEYS for a node of various parameters."""
+    if _ANY_KEYS in schema_node:
+        return _ANY_KEYS
+    return [(key, _entry_fields(value) if isinstance(value, dict) else None) for key, value in schema_node.items()]
+
+
+def _is_int(value):
+    return type(value) is int and _INT_MIN <= value <= _INT_MAX
+
+
+class DailyRecord(Mapping):
+    """
+    Read-only daily entry whose integers and decimals are packed into two arrays, with a layout shared
+    by all the entries of the same shape. Nested nodes are read through lightweight views.
+    Built by `DailyRecordBuilder`.
+    """
+    __slots__ = ("_ints", "_floats", "_others", "_layout")
+
+    def __init__(self, ints, floats, others, layout):
+        self._ints = ints
+        self._floats = floats
+        self._others = others
+        self._layout = layout
+
+    def _value(self, layout, key):
+        field = layout[key]
+        if isinstance(field, dict):
+            return _DailyRecordView(self, field)
+        code, offset = field
+        if code == _INT:
+            return self._ints[offset]
+        if code == _FLOAT:
+            return self._floats[offset]
+        if code == _OTHER:
+            return self._others[offset]
+        if code == _NONE:
+            return None
+        return self._ints[offset:offset+code].tolist()
+
+    def __getitem__(self, key):
+        return self._value(self._layout, key)
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def __len__(self):
+        return len(self._layout)
+
+
+class _DailyRecordView(Mapping):
+    __slots__ = ("_record", "_layout")
+
+    def __init__(self, record, layout):
+        self._record = record
+        self._layout = layout
+
+    def __getitem__(self, key):
+        return self._record._value(self._layout, key)
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def __len__(self):
+        return len(self._layout)
+
+
+class DailyRecordBuilder:
+    """
+    Packs the daily entries described by `schema_node` (the "<date>" node of the resolved schema)
+    into `DailyRecord`s. Leaves are stored by the type of their value, so records give back exactly
+    the values of the entry; the layout of each shape of entry is computed once.
+    """
+
+    def __init__(self, schema_node):
+        self._fields = _entry_fields(schema_node)
+        self._layouts = {}
+
+    def build(self, entry):
+        ints, floats, others, signature = [], [], [], []
+        self._pack(self._fields, entry, ints, floats, others, signature)
+        signature = tuple(signature)
+        if signature not in self._layouts:
+            self._layouts[signature] = self._layout(self._fields, iter(signature), [0, 0, 0])
+        return DailyRecord(array('q', ints), array('d', floats), tuple(others), self._layouts[signature])
+
+    def _pack(self, fields, node, ints, floats, others, signature):
+        if not isinstance(node, dict):
+            raise ValueError("The daily entry does not match the schema")
+        if fields == _ANY_KEYS:
+            signature.append(tuple(node))
+            fields = [(key, None) for key in node]
+        for key, child_fields in fields:
+            value = node[key]
+            if child_fields is not None:
+                self._pack(child_fields, value, ints, floats, others, signature)
+            elif value is None:
+                signature.append(_NONE)
+            elif _is_int(value):
+                ints.append(value)
+                signature.append(_INT)
+            elif type(value) is float:
+                floats.append(value)
+                signature.append(_FLOAT)
+            elif type(value) is list and all(_is_int(x) for x in value):
+                ints.extend(value)
+                signature.append(len(value))
+            else:
+                others.append(value)
+                signature.append(_OTHER)
+
+    def _layout(self, fields, signature, offsets):
+        """{key: sub-layout or (code, offset)}, replaying the codes of `signature` in packing order."""
+        if fields == _ANY_KEYS:
+            fields = [(key, None) for key in next(signature)]
+        layout = {}
+        for key, child_fields in fields:
+            if child_fields is not None:
+                layout[key] = self._layout(child_fields, signature, offsets)
+                continue
+            code = next(signature)
+            if code == _NONE:
+                layout[key] = (code, None)
+                continue
+            # offsets: next free position in the ints, the floats and the other values
+            storage = 1 if code == _FLOAT else 2 if code == _OTHER else 0
+            layout[key] = (code, offsets[storage])
+            offsets[storage] += code if isinstance(code, int) else 1
+        return layout
+
+
+class RecordTypes:
+    """The record classes built from one schema: metadata, region and the builder of daily entries."""
+
+    def __init__(self, schema):
+        resolved = resolve_schema(schema)
+        self.metadata = record_class("Metadata", resolved["metadata"])
+        self.region = record_class("Region", resolved["region"])
+        self.daily = DailyRecordBuilder(resolved["evolution"]["<date>"])
+
+
+_record_types_cache = {}
+
+
+def record_types(schema=SCHEMA_FILEPATH):
+    """`RecordTypes` of `schema` (a filepath, a parsed dict or a `SchemaValidator`), cached for filepaths."""
+    if isinstance(schema, SchemaValidator):
+        return RecordTypes(schema.schema)
+    if isinstance(schema, dict):
+        return RecordTypes(schema)
+    if schema not in _record_types_cache:
+        _record_types_cache[schema] = RecordTypes(load_schema(schema))
+    return _record_types_cache[schema]
+
+
+def to_records(input_data, schema=SCHEMA_FILEPATH):
+    """
+    Region document whose metadata, region and daily entries are compact records, accepted by the
+    analysis functions of process_covid like the nested document it is built from.
+    """
+    types = record_types(schema)
+    return {"metadata": types.metadata(input_data["metadata"]),
+            "region": types.region(input_data["region"]),
+            "evolution": {date: types.daily.build(entry) for date, entry in input_data["evolution"].items()},
+            }
+
+
+def load_covid_records(filepath, schema=SCHEMA_FILEPATH, validate=True):
+    """
+    `to_records` of a region file, streamed one date at a time so the nested document is never held
+    in memory as a whole.
+    """
+    types = record_types(schema)
+    header = {}
+    evolution = {date: types.daily.build(entry) for date, entry in iter_evolution(filepath, header, schema, validate)}
+    return {"metadata": types.metadata(header["metadata"]),
+            "region": types.region(header["region"]),
+            "evolution": evolution,
+            }
@@ -0,0 +1,146 @@
+import json
+import os
+
+import instrument_covid
+from process_covid import SCHEMA_FILEPATH
+from validate_schema import load_schema, format_path, SchemaValidator
+
+CHUNK_SIZE = 2**16
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+
+class _JSONStream:
+    """
+    Reads a JSON document from a text file in chunks, so that only the value being
+    decoded (plus one chunk) is held in memory at a time.
+    """
+
+    def __init__(self, json_file, chunk_size=CHUNK_SIZE):
+        self.json_file = json_file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        chunk = self.json_file.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def next_char(self):
+        """Skip whitespace and return the next character without consuming it."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill(self.chunk_size):
+                raise ValueError("Unexpected end of the JSON file")
+
+    def expect(self, char):
+        if self.next_char() != char:
+            raise ValueError(f"Expected '{char}' but found '{self.buffer[self.pos]}' in the JSON file")
+        self.pos += 1
+
+    def decode_value(self):
+        self.next_char()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Most likely the value continues in the next chunk; read larger chunks each time
+                # so that a value much bigger than a chunk is not re-decoded too many times
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number ending exactly at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.eof and self._fill(size):
+                continue
+            self.pos = end
+            return value
+
+    def iter_object(self):
+        """Yield the keys of the object at the current position; the caller consumes each value."""
+        self.expect("{")
+        if self.next_char() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            if not isinstance(key, str):
+                raise ValueError(f"Object keys must be strings, not {key}")
+            self.expect(":")
+            yield key
+            char = self.next_char()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or '}}' but found '{char}' in the JSON file")
+
+
+def iter_evolution(filepath, header=None, schema=SCHEMA_FILEPATH, validate=True, chunk_size=CHUNK_SIZE):
+    """
+    Stream the "evolution" object of a region file, yielding one (date, entry) pair at a time.
+    Each entry is validated against the schema's (compiled) '<date>' node as soon as it is read,
+    and the other top-level entries once the whole file has been read.
+    header: optional dict, filled with the other top-level entries ("metadata", "region").
+    schema: path to the schema, an already loaded schema dict or a SchemaValidator.
+    """
+    if header is None:
+        header = {}
+    if validate:
+        if isinstance(schema, SchemaValidator):
+            schema = schema.schema
+        elif not isinstance(schema, dict):
+            schema = load_schema(schema)
+        date_validator = SchemaValidator(schema["evolution"]["<date>"])
+
+    n_dates = 0
+    has_evolution = False
+    with open(filepath) as json_file:
+        stream = _JSONStream(json_file, chunk_size)
+        for key in stream.iter_object():
+            if key != "evolution":
+                header[key] = stream.decode_value()
+                continue
+            has_evolution = True
+            for date in stream.iter_object():
+                entry = stream.decode_value()
+                error = date_validator.find_error(entry) if validate else None
+                if error is not None:
+                    location = format_path(["evolution", date] + error)
+                    raise ValueError(f"Incorrect schema given in {filepath} at {location}")
+                n_dates += 1
+                yield date, entry
+    if instrument_covid.enabled:
+        instrument_covid.count("bytes_parsed", os.path.getsize(filepath))
+        instrument_covid.count("dates_loaded", n_dates)
+
+    if validate:
+        if not has_evolution or set(header.keys()) | {"evolution"} != set(schema.keys()):
+            raise ValueError(f"Incorrect schema given in {filepath}")
+        for key, value in header.items():
+            error = SchemaValidator(schema[key]).find_error(value)
+            if error is not None:
+                raise ValueError(f"Incorrect schema given in {filepath} at {format_path([key] + error)}")
+
+
+def stream_covid_data(filepath, consumers, schema=SCHEMA_FILEPATH, validate=True, chunk_size=CHUNK_SIZE):
+    """
+    Feed every date entry of a region file to each of `consumers`, called as consumer(date, entry),
+    without loading the whole file in memory. Returns the other top-level entries.
+    """
+    header = {}
+    for date, entry in iter_evolution(filepath, header, schema, validate, chunk_size):
+        for consumer in consumers:
+            consumer(date, entry)
+    return header
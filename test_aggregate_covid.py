@@ -0,0 +1,81 @@
+import copy
+import json
+from pytest import raises, approx
+from process_covid import load_covid_data, cases_per_population_by_age, hospital_vs_confirmed
+from aggregate_covid import *
+
+
+def split_bins(values):
+    # ['0-24', '25-49', '50-74', '75-'] -> ['0-9', '10-24', '25-49', '50-59', '60-74', '75-']
+    return [values[0] // 2, values[0] - values[0] // 2, values[1],
+            values[2] // 2, values[2] - values[2] // 2, values[3]]
+
+
+def write_regions(directory, sample_filepath):
+    data = load_covid_data(sample_filepath)
+    with open(directory / "region_a.json", "w") as json_file:
+        json.dump(data, json_file)
+
+    data["region"]["key"] = "ER-Mi-XX"
+    data["metadata"]["age_binning"]["hospitalizations"] = ['0-9', '10-24', '25-49', '50-59', '60-74', '75-']
+    for entry in data["evolution"].values():
+        for path in COUNT_PATHS:
+            node = entry
+            for key in path.split("/"):
+                node = node[key]
+            node["age"] = split_bins(node["age"])
+    with open(directory / "region_b.json", "w") as json_file:
+        json.dump(data, json_file)
+    return [str(directory / "region_a.json"), str(directory / "region_b.json")]
+
+
+def test_merge_age_binnings():
+    assert merge_age_binnings([['0-9', '10-19', '20-29', '30-'], ['0-19', '20-29', '30-'], ['0-9', '10-29', '30-']]) \
+        == ['0-29', '30-']
+    with raises(ValueError) as exception:
+        merge_age_binnings([['0-9', '10-'], ['0-14', '15-']])
+
+
+def test_aggregate_regions(tmp_path, sample_filepath):
+    filepaths = write_regions(tmp_path, sample_filepath)
+    data = load_covid_data(sample_filepath)
+    aggregate = aggregate_regions(filepaths, "Eriador", "ER")
+
+    assert aggregate["metadata"]["age_binning"]["hospitalizations"] == ['0-24', '25-49', '50-74', '75-']
+    assert aggregate["region"]["population"]["total"] == 2 * data["region"]["population"]["total"]
+    date = "2020-03-20"
+    confirmed = aggregate["evolution"][date]["epidemiology"]["confirmed"]["total"]
+    expected = data["evolution"][date]["epidemiology"]["confirmed"]["total"]
+    assert confirmed["all"] == 2 * expected["all"]
+    assert confirmed["age"] == [2 * value for value in expected["age"]]
+
+    result = cases_per_population_by_age(aggregate)
+    expected = cases_per_population_by_age(data)
+    for age_bin in expected:
+        assert [ratio for _, ratio in result[age_bin]] == approx([ratio for _, ratio in expected[age_bin]])
+    assert hospital_vs_confirmed(aggregate) == hospital_vs_confirmed(data)
+
+
+def test_aggregate_groups_missing_values(sample_filepath):
+    data = load_covid_data(sample_filepath)
+    dates = list(data["evolution"].keys())
+    other_data = copy.deepcopy(data)
+    other_data["region"]["key"] = "GO-Ro-XX"
+    other_data["evolution"][dates[1]]["epidemiology"]["confirmed"]["new"]["all"] = None
+    del other_data["evolution"][dates[2]]
+
+    aggregate = CovidAggregate("All", "ALL")
+    aggregate.add_region(data, data["evolution"])
+    aggregate.add_region(other_data, other_data["evolution"])
+    result = aggregate.result()
+    assert result["evolution"][dates[0]]["epidemiology"]["confirmed"]["new"]["all"] is not None
+    assert result["evolution"][dates[1]]["epidemiology"]["confirmed"]["new"]["all"] is None
+    assert result["evolution"][dates[2]]["epidemiology"]["confirmed"]["new"]["all"] is None
+    assert result["evolution"][dates[2]]["epidemiology"]["confirmed"]["new"]["age"] == [None] * 4
+
+
+def test_aggregate_groups(tmp_path, sample_filepath):
+    filepaths = write_regions(tmp_path, sample_filepath)
+    groups = aggregate_groups(filepaths, lambda region: (region["key"], region["key"]))
+    assert set(groups.keys()) == {"ER-Mi-EV", "ER-Mi-XX"}
+    assert groups["ER-Mi-XX"]["metadata"]["age_binning"]["population"] == ['0-24', '25-49', '50-74', '75-']
@@ -0,0 +1,51 @@
+import asyncio
+from process_covid import load_covid_data, hospital_vs_confirmed
+from async_covid import *
+
+
+def test_load_and_validate_async(sample_filepath, schema_filepath):
+    source = SlowFileSource(latency=0.01)
+    data = asyncio.run(load_covid_data_async(sample_filepath, read=source))
+    assert data == load_covid_data(sample_filepath)
+    assert asyncio.run(validate_schema_async(schema_filepath, sample_filepath, read=source))
+    assert source.n_reads == 2
+
+
+def test_iter_covid_data(tmp_path, sample_filepath, write_region_files):
+    filepaths = write_region_files(8)
+    with open(tmp_path / "broken.json", "w") as json_file:
+        json_file.write('{"metadata": ')
+    filepaths.append(str(tmp_path / "broken.json"))
+    filepaths.append(str(tmp_path / "missing.json"))
+    expected = hospital_vs_confirmed(load_covid_data(sample_filepath))
+    source = SlowFileSource(latency=0.1)
+
+    async def collect():
+        return [outcome async for outcome in iter_covid_data(filepaths, hospital_vs_confirmed, read=source,
+                                                             concurrency=5)]
+
+    outcomes = asyncio.run(collect())
+    # The 10 reads overlap, 5 at a time
+    assert source.max_in_flight == 5
+    assert sorted(filepath for filepath, _, _ in outcomes) == sorted(filepaths)
+    for filepath, result, exception in outcomes:
+        if filepath.endswith(("broken.json", "missing.json")):
+            assert result is None and exception is not None
+        else:
+            assert result == expected and exception is None
+
+
+def test_iter_covid_data_backpressure(write_region_files):
+    filepaths = write_region_files(20)
+    source = SlowFileSource(latency=0)
+
+    async def consume_first():
+        outcomes = iter_covid_data(filepaths, len, read=source, concurrency=2, buffer_size=1)
+        filepath, result, exception = await outcomes.__anext__()
+        await asyncio.sleep(0.3)
+        n_reads = source.n_reads
+        await outcomes.aclose()
+        return n_reads
+
+    # Yielded, waiting in both queues, being parsed, and held by the 2 readers
+    assert asyncio.run(consume_first()) <= 6
@@ -0,0 +1,88 @@
+import json
+import os
+from pytest import raises
+from process_covid import load_covid_data, hospital_vs_confirmed
+from batch_covid import *
+
+
+def write_batch_files(write_region_files, directory):
+    # region_1 has no confirmed cases by age
+    filepaths = write_region_files(2)
+    data = load_covid_data(filepaths[1])
+    for entry in data["evolution"].values():
+        entry["epidemiology"]["confirmed"]["total"]["age"] = [None] * 4
+    with open(filepaths[1], "w") as json_file:
+        json.dump(data, json_file)
+    with open(directory / "broken.json", "w") as json_file:
+        json_file.write('{"metadata": ')
+
+
+def test_find_region_files(sample_filepath):
+    assert find_region_files("covid_data") == [sample_filepath]
+
+
+def test_process_covid_batch(tmp_path, sample_filepath, write_region_files):
+    write_batch_files(write_region_files, tmp_path)
+    expected = hospital_vs_confirmed(load_covid_data(sample_filepath))
+
+    for workers in [1, 2]:
+        results, errors = process_covid_batch(str(tmp_path), workers=workers)
+        assert set(results.keys()) == {"R0", "R1"}
+        assert results["R0"]["hospital_vs_confirmed"] == expected
+        assert set(results["R0"].keys()) == set(ANALYSES.keys())
+        assert "cases_per_population_by_age" not in results["R1"]
+        assert set(errors.keys()) == {str(tmp_path / "broken.json"), str(tmp_path / "region_1.json")}
+
+    # region_2 has the key of region_0 and its results are dropped, whichever file is processed first
+    data = load_covid_data(sample_filepath)
+    data["region"]["key"] = "R0"
+    data["evolution"] = dict(list(data["evolution"].items())[:10])
+    with open(tmp_path / "region_2.json", "w") as json_file:
+        json.dump(data, json_file)
+    for workers in [1, 2]:
+        results, errors = process_covid_batch(str(tmp_path / "region_*.json"), ["hospital_vs_confirmed"],
+                                              workers=workers)
+        assert results["R0"] == {"hospital_vs_confirmed": expected}
+        assert "already loaded" in errors[str(tmp_path / "region_2.json")][0]
+    (tmp_path / "region_2.json").unlink()
+
+    results, errors = process_covid_batch(str(tmp_path / "region_*.json"), ["hospital_vs_confirmed"], workers=1)
+    assert errors == {}
+    assert results["R1"] == {"hospital_vs_confirmed": expected}
+
+    with raises(ValueError) as exception:
+        process_covid_batch(str(tmp_path), ["plot_everything"])
+
+
+def test_render_plots_batch(tmp_path, sample_filepath, write_region_files):
+    write_batch_files(write_region_files, tmp_path)
+    # Same region key as region_0, but fewer dates and so different plots
+    data = load_covid_data(sample_filepath)
+    data["region"]["key"] = "R0"
+    data["evolution"] = dict(list(data["evolution"].items())[:5])
+    with open(tmp_path / "region_2.json", "w") as json_file:
+        json.dump(data, json_file)
+    expected_dir = tmp_path / "expected"
+    expected_dir.mkdir()
+    expected = {}
+    for expected_filepath, _ in render_region_plots(str(tmp_path / "region_0.json"), str(expected_dir)):
+        with open(expected_filepath, "rb") as plot_file:
+            expected[os.path.basename(expected_filepath)] = plot_file.read()
+
+    for workers in [1, 2]:
+        output_dir = tmp_path / f"plots_{workers}"
+        timings, errors, total = render_plots_batch(str(tmp_path / "region_*.json"), str(output_dir), workers=workers)
+        # region_1 has no confirmed cases by age, so its age plot cannot be drawn
+        assert set(errors.keys()) == {str(tmp_path / "region_1.json"), str(tmp_path / "region_2.json")}
+        assert "already rendered" in errors[str(tmp_path / "region_2.json")][0]
+        assert set(timings.keys()) == {str(output_dir / f"R0_evolution_cases_{type_plot}.png")
+                                       for type_plot in ["sex", "age"]}
+        assert total >= max(timings.values())
+        # Only the plots of region_0, the first file with the key, are written; failed files write none
+        assert sorted(os.listdir(output_dir)) == sorted(expected)
+        for name, content in expected.items():
+            with open(output_dir / name, "rb") as plot_file:
+                assert plot_file.read() == content
+
+    timings, errors, total = render_plots_batch(str(tmp_path), str(tmp_path / "plots"), workers=1)
+    assert str(tmp_path / "broken.json") in errors
@@ -0,0 +1,16 @@
+from pytest import raises
+from benchmark_covid import *
+
+
+def test_synthetic_age_binning():
+    assert synthetic_age_binning(2) == ["0-49", "50-"]
+    assert synthetic_age_binning(100)[-2:] == ["98-98", "99-"]
+    for n_age_bins in [1, 101]:
+        with raises(ValueError) as exception:
+            synthetic_age_binning(n_age_bins)
+
+
+def test_run_suite():
+    records = run_suite(n_dates_list=(10,), n_age_bins_list=(2, 100), repeat=1)
+    assert len(records) == 2 * 7
+    assert all(record["seconds"] > 0 and record["dates_per_second"] > 0 for record in records)
@@ -0,0 +1,91 @@
+import copy
+import json
+import os
+from pytest import raises
+import process_covid
+from process_covid import load_covid_data
+from validate_schema import load_schema, schema_fingerprint
+from cache_covid import *
+
+
+def test_cache_get_put(tmp_path):
+    cache = CovidDataCache(str(tmp_path / "cache"))
+    filepath = str(tmp_path / "region.json")
+    with open(filepath, "w") as json_file:
+        json.dump({"evolution": {}}, json_file)
+
+    assert cache.get(filepath) is None
+    cache.put(filepath, {"evolution": {}})
+    assert cache.get(filepath) == {"evolution": {}}
+    assert cache.get(filepath, columnar=True) is None
+
+    with open(filepath, "w") as json_file:
+        json.dump({"evolution": {"2020-01-01": {}}}, json_file)
+    assert cache.get(filepath) is None
+
+    cache.put(filepath, {"evolution": {"2020-01-01": {}}})
+    cache.invalidate(filepath)
+    assert cache.get(filepath) is None
+    assert cache.size() == 0
+
+
+def test_cache_eviction(tmp_path):
+    cache = CovidDataCache(str(tmp_path / "cache"), max_bytes=3000)
+    filepaths = []
+    for i in range(3):
+        filepaths.append(str(tmp_path / f"region_{i}.json"))
+        with open(filepaths[-1], "w") as json_file:
+            json.dump({}, json_file)
+    cache.put(filepaths[0], "x" * 1000)
+    cache.put(filepaths[1], "x" * 1000)
+    os.utime(cache._entry_path(filepaths[0], False), ns=(0, 0))
+    os.utime(cache._entry_path(filepaths[1], False), ns=(1, 1))
+    assert cache.get(filepaths[0]) == "x" * 1000  # now the most recently used
+    cache.put(filepaths[2], "x" * 1000)
+
+    assert cache.get(filepaths[1]) is None
+    assert cache.get(filepaths[0]) == "x" * 1000
+    assert cache.get(filepaths[2]) == "x" * 1000
+    assert cache.size() <= 3000
+
+    cache.clear()
+    assert cache.size() == 0
+
+
+def test_load_covid_data_cache(tmp_path, sample_filepath, schema_filepath):
+    cache = CovidDataCache(str(tmp_path / "cache"))
+    fingerprint = schema_fingerprint(schema_filepath)
+    for columnar in [False, True]:
+        data = load_covid_data(sample_filepath, columnar=columnar, cache=cache)
+        assert cache.get(sample_filepath, columnar, fingerprint) == data
+        assert cache.get(sample_filepath, columnar) is None
+        assert load_covid_data(sample_filepath, columnar=columnar, cache=cache) == data
+
+    # Data cached under the default schema is not returned for a stricter one
+    schema = copy.deepcopy(load_schema(schema_filepath))
+    schema["region"]["extra"] = "Integer"
+    assert schema_fingerprint(schema) != fingerprint
+    with raises(ValueError) as exception:
+        load_covid_data(sample_filepath, schema, cache=cache)
+    assert load_covid_data(sample_filepath, cache=cache) == load_covid_data(sample_filepath)
+
+
+def test_load_covid_data_cache_file_rewritten(tmp_path, sample_filepath, monkeypatch):
+    # A daily feed appends a date to the file while the previous version is being parsed
+    data = load_covid_data(sample_filepath)
+    filepath = str(tmp_path / "region.json")
+    with open(filepath, "w") as json_file:
+        json.dump(dict(data, evolution=dict(list(data["evolution"].items())[:39])), json_file)
+    parse_covid_data = process_covid.parse_covid_data
+
+    def parse_then_append(*args):
+        parsed = parse_covid_data(*args)
+        with open(filepath, "w") as json_file:
+            json.dump(data, json_file)
+        return parsed
+
+    cache = CovidDataCache(str(tmp_path / "cache"))
+    monkeypatch.setattr(process_covid, "parse_covid_data", parse_then_append)
+    assert len(load_covid_data(filepath, cache=cache)["evolution"]) == 39
+    monkeypatch.undo()
+    assert len(load_covid_data(filepath, cache=cache)["evolution"]) == 40
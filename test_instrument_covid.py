@@ -0,0 +1,47 @@
+from pytest import raises
+import instrument_covid
+from instrument_covid import *
+from process_covid import load_covid_data, cases_per_population_by_age, hospital_vs_confirmed
+
+
+def test_recording(sample_filepath):
+    assert not instrument_covid.enabled
+    with recording() as recorder:
+        assert instrument_covid.enabled
+        data = load_covid_data(sample_filepath)
+        cases_per_population_by_age(data)
+        hospital_vs_confirmed(data)
+    assert not instrument_covid.enabled
+
+    assert {"parse", "validate", "rebin"} <= set(recorder.stage_seconds().keys())
+    counters = recorder.counters()
+    assert counters["dates_loaded"] == 40
+    assert counters["dates_processed"] == 80
+    assert counters["missing_values_skipped"] == 0
+    assert counters["nodes_validated"] > 40
+    assert counters["bytes_parsed"] > 0
+
+    hospital_vs_confirmed(data)
+    assert recorder.counters() == counters
+
+
+def test_stage_and_listeners(tmp_path):
+    records = []
+    add_listener(records.append)
+    with raises(ValueError) as exception:
+        with stage("failing"):
+            raise ValueError("failure")
+    count("things", 3)
+    remove_listener(records.append)
+    count("things", 3)
+
+    assert [(record["type"], record["name"]) for record in records] == [("stage", "failing"), ("counter", "things")]
+    assert records[0]["failed"]
+    assert records[1]["value"] == 3
+
+    recorder = Recorder()
+    for record in records:
+        recorder(record)
+    recorder.save(str(tmp_path / "records.jsonl"))
+    with open(tmp_path / "records.jsonl") as records_file:
+        assert len(records_file.readlines()) == 2
@@ -0,0 +1,70 @@
+import json
+from collections.abc import Mapping
+import pytest
+from process_covid import (load_covid_data, cases_per_population_by_age, hospital_vs_confirmed,
+                           count_high_rain_low_tests_days, generate_data_plots_confirmed)
+from lazy_covid import *
+
+
+def to_dict(node):
+    if isinstance(node, Mapping):
+        return {key: to_dict(value) for key, value in node.items()}
+    return node
+
+
+def test_lazy_matches_loaded_data(sample_filepath):
+    input_data = load_covid_data(sample_filepath)
+    with LazyCovidData(sample_filepath) as lazy_data:
+        assert list(lazy_data["evolution"]) == list(input_data["evolution"])
+        assert to_dict(lazy_data) == input_data
+
+
+def test_lazy_analyses(sample_filepath):
+    input_data = load_covid_data(sample_filepath)
+    with LazyCovidData(sample_filepath) as lazy_data:
+        assert cases_per_population_by_age(lazy_data) == cases_per_population_by_age(input_data)
+        assert hospital_vs_confirmed(lazy_data) == hospital_vs_confirmed(input_data)
+        assert count_high_rain_low_tests_days(lazy_data) == count_high_rain_low_tests_days(input_data)
+        assert (generate_data_plots_confirmed(lazy_data, ("male", "female"), (25, 50, 75), ("new", "total"))
+                == generate_data_plots_confirmed(input_data, ("male", "female"), (25, 50, 75), ("new", "total")))
+
+
+@pytest.mark.parametrize("separators", [(",", ":"), (", ", ": ")])
+def test_lazy_offsets(tmp_path, separators):
+    # Braces and digits in strings must not be mistaken for date entries
+    data = {"metadata": {"note": "{\"2020-01-01\": {"},
+            "evolution": {"01-01-2020": {"a": {"b": [1, 2]}, "c": "}"},
+                          "01-02-2020": {"a": {"b": [3, 4]}, "c": "{"},
+                          "01-03-2020": {}},
+            "region": {"name": "[x]"}}
+    # The braces in the strings balance the ones of "t", and "9z" looks like the next date
+    data["evolution"]["01-04-2020"] = {"s": "}", "t": {"u": 1}, "9z": {"v": 2}, "w": "\\\"{"}
+    data["evolution"]["01-05-2020"] = {"x": 5}
+    # "w" is also a key of nested objects and appears in a string before the member itself,
+    # and the non-ASCII key is escaped in the file
+    data["evolution"]["01-06-2020"] = {"a": {"w": 1, "b": [{"w": 0}]}, "s": "{\"w\": 3", "t": "[\"w\"",
+                                       "w": 2.5, "\u00e9": {"w": None}}
+    filepath = str(tmp_path / "region.json")
+    with open(filepath, "w") as json_file:
+        json.dump(data, json_file, separators=separators)
+    with open(filepath, "rb") as json_file:
+        content = json_file.read()
+
+    with LazyCovidData(filepath) as lazy_data:
+        assert to_dict(lazy_data) == data
+        for date, (start, end) in lazy_data.evolution_offsets.items():
+            assert json.loads(content[start:end]) == data["evolution"][date]
+        entry = lazy_data["evolution"]["01-02-2020"]
+        assert entry["c"] == "{"
+        assert entry["a"]["b"] == [3, 4]
+        with pytest.raises(KeyError):
+            entry["d"]
+        assert list(lazy_data["evolution"]) == list(data["evolution"])
+        assert lazy_data["evolution"]["01-04-2020"]["9z"] == {"v": 2}
+        entry = lazy_data["evolution"]["01-06-2020"]
+        assert entry["w"] == 2.5
+        assert entry["\u00e9"]["w"] is None
+        assert entry["a"]["b"] == [{"w": 0}]
+        with pytest.raises(KeyError):
+            entry["a"]["s"]
+        assert entry is lazy_data["evolution"]["01-06-2020"]
@@ -1,3 +1,5 @@
+import random
+from array import array
 from pytest import raises, approx
 from process_covid import *
 
@@ -15,10 +17,48 @@ def test_compute_running_average():
     equality_list(compute_running_average([0, 1, 5, 2, 2, 5], 3), [None, 2.0, 2.6666, 3.0, 3.0, None])
     equality_list(compute_running_average([2, None, 4], 3), [None, 3.0, None])
     equality_list(compute_running_average([2, None, 4], 5), [None, None, None])
+    equality_list(compute_running_average([None, None, None, 4], 3), [None, None, 4.0, None])
+    equality_list(compute_running_average([0, 1, 5, 2, 2, 5], 1), [0.0, 1.0, 5.0, 2.0, 2.0, 5.0])
+    equality_list(compute_running_average(array('d', [0, 1, 5, 2]), 3), [None, 2.0, 2.6666, None])
+
+    result = compute_running_average([[0, 1, 5, 2, 2, 5], [2, None, 4]], 3)
+    equality_list(result[0], [None, 2.0, 2.6666, 3.0, 3.0, None])
+    equality_list(result[1], [None, 3.0, None])
+
+
+def running_average_loop(data, window):
+    # compute_running_average before prefix sums, as the reference for float series
+    shift = (window - 1) // 2
+    result = []
+    for i in range(len(data)):
+        if i < shift or i >= len(data) - shift:
+            result.append(None)
+            continue
+        sum_window, n_values = 0, 0
+        for value in data[i-shift:i+shift+1]:
+            if value is not None:
+                sum_window += value
+                n_values += 1
+        result.append(None if n_values == 0 else sum_window / n_values)
+    return result
+
+
+def test_compute_running_average_floats():
+    rng = random.Random(0)
+    data = [rng.uniform(0, 1e6) for _ in range(5000)] + [0.004] * 100 + [None, 0.5, None]
+    for window in [3, 7, 31]:
+        assert compute_running_average(data, window) == running_average_loop(data, window)
+    data = [1e16, 1, -1e16, 1] * 10
+    assert compute_running_average(data, 3) == running_average_loop(data, 3)
+    assert compute_running_average(array('d', data), 3) == running_average_loop(data, 3)
 
 
 def test_simple_derivative():
     equality_list(simple_derivative([None, 1, 2, None, 4]), [None, None, 1, None, None])
+    equality_list(simple_derivative(array('l', [1, 3, 2])), [None, 2, -1])
+    result = simple_derivative([[None, 1, 2, None, 4], [1, 3]])
+    equality_list(result[0], [None, None, 1, None, None])
+    equality_list(result[1], [None, 2])
 
 
 def test_sum_sublists():
@@ -102,7 +142,7 @@ def test_cases_per_population_by_age():
         cases_per_population_by_age(input_data)
 
 
-def test_load_covid_data():
+def test_load_covid_data(tmp_path, sample_filepath, schema_filepath):
     input_data = {"metadata": {"age_binning": {"population": ['0-19', '20-39', '40-'],
                                                "hospitalizations": ['0-9', '10-39', '40-49', '50-']}},
                   "region": {"population": {"age": [100, 200, 800]}},
@@ -111,11 +151,20 @@ def test_load_covid_data():
                                 "01-02-2020":
                                     {"epidemiology": {"confirmed": {"total": {"age": [20, 100, 20, 60]}}}}}}
 
-    with open('fake_data.json', 'w') as fake_datafile:
+    filepath = str(tmp_path / "fake_data.json")
+    with open(filepath, 'w') as fake_datafile:
         json.dump(input_data, fake_datafile)
 
     with raises(ValueError) as exception:
-        load_covid_data("fake_data.json")
+        load_covid_data(filepath)
+    assert "'metadata'" in str(exception.value)
+
+    assert load_covid_data(filepath, validate=False) == input_data
+
+    with open(schema_filepath) as schema_file:
+        schema = json.load(schema_file)
+    data = load_covid_data(sample_filepath, schema=schema)
+    assert data["region"]["key"] == "ER-Mi-EV"
 
 
 def test_hospital_vs_confirmed():
@@ -157,3 +206,139 @@ def test_generate_data_plot_confirmed():
 
     with raises(ValueError) as exception:
         generate_data_plot_confirmed(input_data, sex=None, max_age="infinity", status="new")
+
+
+def test_to_columnar(sample_filepath):
+    input_data = {"evolution": {"01-01-2020": {"weather": {"rainfall": 2.5},
+                                               "epidemiology": {"confirmed": {"total": {"age": [1, 2]}}}},
+                                "01-02-2020": {"weather": {"rainfall": None},
+                                               "epidemiology": {"confirmed": {"total": {"age": [3, 4]}}}}}}
+    columnar_data = to_columnar(input_data)
+    assert columnar_data["dates"] == ["01-01-2020", "01-02-2020"]
+    assert columnar_data["columns"] == {"weather/rainfall": [2.5, None],
+                                        "epidemiology/confirmed/total/age": [[1, 2], [3, 4]]}
+    assert get_series(columnar_data, "weather/rainfall") == get_series(input_data, "weather/rainfall")
+
+    filepath = sample_filepath
+    data = load_covid_data(filepath)
+    columnar_data = load_covid_data(filepath, columnar=True)
+    assert "evolution" not in columnar_data
+    assert cases_per_population_by_age(columnar_data) == cases_per_population_by_age(data)
+    assert hospital_vs_confirmed(columnar_data) == hospital_vs_confirmed(data)
+    assert count_high_rain_low_tests_days(columnar_data) == count_high_rain_low_tests_days(data)
+    assert (generate_data_plot_confirmed(columnar_data, None, 37, "new")
+            == generate_data_plot_confirmed(data, None, 37, "new"))
+    assert (generate_data_plot_confirmed(columnar_data, "female", None, "total")
+            == generate_data_plot_confirmed(data, "female", None, "total"))
+
+
+def test_rebinning_plan():
+    plan = get_rebinning_plan(['0-19', '20-39', '40-'], ['0-9', '10-39', '40-49', '50-'])
+    assert plan is get_rebinning_plan(('0-19', '20-39', '40-'), ('0-9', '10-39', '40-49', '50-'))
+    equality_list(plan.age_binning, ('0-39', '40-'))
+    equality_list(plan.rebin([100, 200, 800], 0), [300, 800])
+    assert plan.rebin_matrix([[10, 50, 20, 60], [20, 100, 20, 60]], 1) == [[60, 80], [120, 80]]
+
+    with raises(ValueError) as exception:
+        plan.rebin([100, 200], 0)
+    with raises(ValueError) as exception:
+        get_rebinning_plan(['0-14', '15-29', '30-44', '45-'], ['0-19', '20-39', '40-'])
+
+
+def test_render_confirmed_plot(tmp_path, monkeypatch, sample_filepath):
+    data = load_covid_data(sample_filepath, columnar=True)
+    region_name = data["region"]["name"]
+
+    filepath = render_confirmed_plot(data, sex=True, output_dir=str(tmp_path), fmt="svg")
+    assert filepath == str(tmp_path / f"{region_name}_evolution_cases_sex.svg")
+    assert os.path.getsize(filepath) > 0
+
+    figure = Figure()
+    filepath = render_confirmed_plot(data, max_ages=[15, 37], output_dir=str(tmp_path), figure=figure)
+    assert filepath == str(tmp_path / f"{region_name}_evolution_cases_age.png")
+    assert len(figure.axes) == 1
+    assert plt.get_fignums() == []
+
+    with raises(ValueError) as exception:
+        render_confirmed_plot(data, sex=True, max_ages=[15], output_dir=str(tmp_path))
+
+    monkeypatch.chdir(tmp_path)
+    create_confirmed_plot(data, sex=True, save=True)
+    assert os.path.exists(f"{region_name}_evolution_cases_sex.png")
+    assert plt.get_fignums() == []
+
+
+def test_generate_data_plots_confirmed(sample_filepath):
+    filepath = sample_filepath
+    for data in [load_covid_data(filepath), load_covid_data(filepath, columnar=True)]:
+        data_plots = generate_data_plots_confirmed(data, sexes=["male", "female"], max_ages=[15, 37, 99],
+                                                   statuses=["new", "total"])
+        assert [dp['label'] for dp in data_plots] == [
+            "new male", "new female", "new younger than 24", "new younger than 49", "new younger than 200",
+            "total male", "total female", "total younger than 24", "total younger than 49", "total younger than 200"]
+        # The age bins of the sample are 0-24, 25-49, 50-74 and 75-
+        assert [dp['actual_max_age'] for dp in data_plots[2:5]] == ["24", "49", "200"]
+        assert [dp['color'] for dp in data_plots[:5]] == ["green", "purple", "green", "orange", "pink"]
+        assert [dp['linestyle'] for dp in data_plots[4:6]] == ["--", "-"]
+        assert all(len(dp['value']) == 40 for dp in data_plots)
+        expected_values = {0: ([66, 424, 77, 480, 192, 159], [1142, 1782, 551]),
+                           2: ([29, 130, 25, 148, 59, 54], [406, 569, 193]),
+                           4: ([144, 790, 164, 938, 376, 300], [2331, 3480, 1092]),
+                           6: ([857310, 857676, 857763, 858221, 858405, 858546], [872243, 873941, 874482]),
+                           8: ([856797, 857205, 857282, 857757, 857940, 858099], [871619, 873306, 873872])}
+        for idx, (first_values, last_values) in expected_values.items():
+            assert list(data_plots[idx]['value'][:6]) == first_values
+            assert list(data_plots[idx]['value'][-3:]) == last_values
+        assert data_plots[3] == generate_data_plot_confirmed(data, None, 37, "new")
+
+    input_data = {"metadata": {"age_binning": {"hospitalizations": ['0-9', '10-39', '40-']}},
+                  "evolution": {"01-01-2020": {"epidemiology": {"confirmed": {"new": {"age": [1, 2, None]}}}},
+                                "01-02-2020": {"epidemiology": {"confirmed": {"new": {"age": [3, 4, 5]}}}}}}
+    data_plots = generate_data_plots_confirmed(input_data, max_ages=[5, 20], statuses=["new"])
+    assert [dp['value'] for dp in data_plots] == [[1, 3], [3, 7]]
+    with raises(ValueError) as exception:
+        generate_data_plots_confirmed(input_data, max_ages=[50], statuses=["new"])
+    with raises(ValueError) as exception:
+        generate_data_plots_confirmed(input_data, sexes=["other"])
+
+
+def test_covid_query():
+    input_data = {"evolution": {"2020-01-03": {"weather": {"rainfall": 3}},
+                                "2020-01-01": {"weather": {"rainfall": 1}},
+                                "2020-01-02": {"weather": {"rainfall": None}}}}
+    query = CovidQuery(input_data)
+    assert query["dates"] == ["2020-01-01", "2020-01-02", "2020-01-03"]
+    assert query.rows["2020-01-03"] == 2
+    assert query.row_range("2020-01-02", None) == (1, 3)
+    assert query.select("weather/rainfall") == [1, None, 3]
+    assert query.select("weather/rainfall", "2020-01-02", "2020-01-02") == [None]
+    assert query.select("weather/rainfall", stop_date="2019-12-31") == []
+    assert query.select_dates("2019-06-01", "2020-01-02") == ["2020-01-01", "2020-01-02"]
+    with raises(KeyError) as exception:
+        query.select("weather/temperature")
+
+    view = query.select("weather/rainfall", "2020-01-02")
+    assert view[1:] == [3] and view[-1] == 3 and len(view[5:]) == 0
+    query["columns"]["weather/rainfall"][2] = 4  # views share the storage of the columns
+    assert view == [None, 4]
+
+
+def test_analyses_date_range(sample_filepath):
+    data = load_covid_data(sample_filepath)
+    start_date, stop_date = "2020-03-25", "2020-04-10"
+    window = {key: value for key, value in data.items() if key != "evolution"}
+    window["evolution"] = {date: entry for date, entry in data["evolution"].items() if start_date <= date <= stop_date}
+
+    columnar_data = to_columnar(data)
+    # Rows out of date order, which a plain columnar store cannot bisect
+    unsorted_data = dict(columnar_data, dates=columnar_data["dates"][::-1],
+                         columns={path: column[::-1] for path, column in columnar_data["columns"].items()})
+    for input_data in [data, columnar_data, unsorted_data, CovidQuery(data)]:
+        assert hospital_vs_confirmed(input_data, start_date, stop_date) == hospital_vs_confirmed(window)
+        assert (cases_per_population_by_age(input_data, start_date, stop_date)
+                == cases_per_population_by_age(window))
+        assert (count_high_rain_low_tests_days(input_data, start_date, stop_date)
+                == count_high_rain_low_tests_days(window))
+        assert (generate_data_plots_confirmed(input_data, ["male"], [37], ["new"], start_date, stop_date)
+                == generate_data_plots_confirmed(window, ["male"], [37], ["new"]))
+    assert hospital_vs_confirmed(CovidQuery(data), start_date) == hospital_vs_confirmed(data, start_date)
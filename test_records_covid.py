@@ -0,0 +1,72 @@
+import json
+import tracemalloc
+from array import array
+from collections.abc import Mapping
+from process_covid import (load_covid_data, cases_per_population_by_age, hospital_vs_confirmed,
+                           count_high_rain_low_tests_days, generate_data_plots_confirmed, to_columnar)
+from validate_schema import load_schema
+from records_covid import *
+
+
+def to_plain(node):
+    if isinstance(node, Mapping):
+        return {key: to_plain(value) for key, value in node.items()}
+    if isinstance(node, (tuple, array)):
+        return list(node)
+    return node
+
+
+def test_resolve_schema(schema_filepath):
+    resolved = resolve_schema(load_schema(schema_filepath))["evolution"]["<date>"]
+    counts = resolved["hospitalizations"]["hospitalized"]["new"]
+    assert counts == {"all": "Integer", "male": "Integer", "female": "Integer", "age": "[Integer]"}
+    assert resolved["hospitalizations"]["ventilator"]["current"] == counts
+    assert resolved["epidemiology"]["tested"]["total"] == counts
+    assert resolve_schema({"a": {"b": "Integer"}, "c": "<idem a>"}) == {"a": {"b": "Integer"}, "c": {"b": "Integer"}}
+
+
+def test_records_match_loaded_data(sample_filepath):
+    input_data = load_covid_data(sample_filepath)
+    for records in [to_records(input_data), load_covid_records(sample_filepath)]:
+        assert to_plain(records) == input_data
+        assert type(records["region"]).__name__ == "RegionRecord"
+        assert records["region"].population.age == array('q', input_data["region"]["population"]["age"])
+        assert records["metadata"].time_range.start_date == "2020-03-16"
+
+    records = to_records(input_data)
+    assert cases_per_population_by_age(records) == cases_per_population_by_age(input_data)
+    assert hospital_vs_confirmed(records) == hospital_vs_confirmed(input_data)
+    assert count_high_rain_low_tests_days(records) == count_high_rain_low_tests_days(input_data)
+    assert (generate_data_plots_confirmed(records, ["female"], [37], ["new", "total"])
+            == generate_data_plots_confirmed(input_data, ["female"], [37], ["new", "total"]))
+    assert to_columnar(records)["columns"] == to_columnar(input_data)["columns"]
+
+
+def test_daily_record_values():
+    schema = {"metadata": {}, "region": {},
+              "evolution": {"<date>": {"counts": {"all": "Integer", "age": "[Integer]"},
+                                       "rainfall": "Decimal",
+                                       "response": {"<various_parameters>": "Integer"}}}}
+    entries = [{"counts": {"all": 3, "age": [1, 2]}, "rainfall": 0, "response": {"a": 1, "index": 2.5}},
+               {"counts": {"all": None, "age": [None, 2]}, "rainfall": 1.5, "response": {"b": 2**70}}]
+    builder = record_types(schema).daily
+    records = [builder.build(entry) for entry in entries]
+    for record, entry in zip(records, entries):
+        assert to_plain(record) == entry
+    assert type(records[0]["rainfall"]) is int
+    assert list(records[1]["response"]) == ["b"]
+    assert records[0]._layout is builder.build(entries[0])._layout
+
+
+def test_records_memory(sample_filepath):
+    with open(sample_filepath) as json_file:
+        content = json_file.read()
+
+    def retained(function):
+        tracemalloc.start()
+        data = function(json.loads(content))
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size
+
+    assert retained(to_records) < retained(lambda input_data: input_data) / 3
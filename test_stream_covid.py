@@ -0,0 +1,55 @@
+import json
+from pytest import raises
+from process_covid import load_covid_data, hospital_vs_confirmed
+from stream_covid import *
+
+
+def test_iter_evolution(sample_filepath):
+    data = load_covid_data(sample_filepath)
+
+    for chunk_size in [5, 1000, CHUNK_SIZE]:
+        header = {}
+        evolution = dict(iter_evolution(sample_filepath, header, chunk_size=chunk_size))
+        assert evolution == data["evolution"]
+        assert header == {"metadata": data["metadata"], "region": data["region"]}
+
+
+def test_iter_evolution_invalid(tmp_path, sample_filepath):
+    data = load_covid_data(sample_filepath)
+    date = list(data["evolution"].keys())[3]
+    del data["evolution"][date]["weather"]
+    filepath = str(tmp_path / "fake_data.json")
+    with open(filepath, 'w') as fake_datafile:
+        json.dump(data, fake_datafile)
+
+    dates = []
+    with raises(ValueError) as exception:
+        for date_read, entry in iter_evolution(filepath):
+            dates.append(date_read)
+    assert date in str(exception.value)
+    assert len(dates) == 3
+
+    assert len(list(iter_evolution(filepath, validate=False))) == len(data["evolution"])
+
+    del data["evolution"]
+    with open(filepath, 'w') as fake_datafile:
+        json.dump(data, fake_datafile)
+    with raises(ValueError) as exception:
+        list(iter_evolution(filepath))
+    assert list(iter_evolution(filepath, validate=False)) == []
+
+
+def test_stream_covid_data(sample_filepath):
+    data = load_covid_data(sample_filepath)
+    dates, ratios = [], []
+
+    def hospital_consumer(date, entry):
+        n_hospitalized = entry["hospitalizations"]["hospitalized"]["new"]["all"]
+        n_cases = entry["epidemiology"]["confirmed"]["new"]["all"]
+        if n_hospitalized is not None and n_cases is not None:
+            dates.append(date)
+            ratios.append(n_hospitalized / n_cases)
+
+    header = stream_covid_data(sample_filepath, [hospital_consumer])
+    assert header["region"] == data["region"]
+    assert (dates, ratios) == hospital_vs_confirmed(data)
@@ -0,0 +1,62 @@
+import copy
+from pytest import raises
+from process_covid import *
+from update_covid import *
+
+
+def test_incremental_matches_full_recompute(sample_filepath):
+    data = load_covid_data(sample_filepath)
+    # Make some of the values missing, so the running average has to skip them
+    dates = list(data["evolution"].keys())
+    for date in dates[10:14]:
+        data["evolution"][date]["epidemiology"]["tested"]["new"]["all"] = None
+    data["evolution"][dates[20]]["hospitalizations"]["hospitalized"]["new"]["all"] = None
+    # Float values would lose precision in prefix sums
+    for date, n_tests in zip(dates[25:29], [1e16, 0.1, -1e16, 0.3]):
+        data["evolution"][date]["epidemiology"]["tested"]["new"]["all"] = n_tests
+
+    analysis = IncrementalCovidAnalysis(data)
+    for n_dates, date in enumerate(dates, start=1):
+        analysis.append({date: data["evolution"][date]})
+        partial_data = dict(data, evolution={d: data["evolution"][d] for d in dates[:n_dates]})
+
+        assert analysis.cases_per_population_by_age() == cases_per_population_by_age(partial_data)
+        assert analysis.hospital_vs_confirmed() == hospital_vs_confirmed(partial_data)
+        test_data = get_series(partial_data, "epidemiology/tested/new/all")
+        assert analysis.running_average() == compute_running_average(test_data, 7)
+        try:
+            expected = count_high_rain_low_tests_days(partial_data)
+        except ZeroDivisionError:
+            # No day with more rain yet
+            with raises(ZeroDivisionError):
+                analysis.count_high_rain_low_tests_days()
+        else:
+            assert analysis.count_high_rain_low_tests_days() == expected
+
+    assert IncrementalCovidAnalysis.from_data(data).hospital_vs_confirmed() == hospital_vs_confirmed(data)
+
+
+def test_incremental_errors(sample_filepath):
+    data = load_covid_data(sample_filepath)
+    dates = list(data["evolution"].keys())
+    analysis = IncrementalCovidAnalysis(data)
+    analysis.append({dates[0]: data["evolution"][dates[0]]})
+
+    with raises(ValueError) as exception:
+        analysis.append({dates[0]: data["evolution"][dates[0]]})
+
+    invalid_entry = copy.deepcopy(data["evolution"][dates[2]])
+    del invalid_entry["weather"]
+    with raises(ValueError) as exception:
+        analysis.append({dates[1]: data["evolution"][dates[1]], dates[2]: invalid_entry})
+    assert analysis.dates == dates[:1]
+
+    entry = copy.deepcopy(data["evolution"][dates[1]])
+    entry["epidemiology"]["confirmed"]["total"]["age"][0] = None
+    analysis.append({dates[1]: entry})
+    with raises(ValueError) as exception:
+        analysis.cases_per_population_by_age()
+    assert analysis.hospital_vs_confirmed()[0] == dates[:2]
+
+    with raises(ValueError) as exception:
+        IncrementalCovidAnalysis({"metadata": data["metadata"], "region": {}})
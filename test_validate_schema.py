@@ -0,0 +1,51 @@
+import copy
+import json
+from validate_schema import *
+
+
+def load_sample(sample_filepath):
+    with open(sample_filepath) as json_file:
+        return json.load(json_file)
+
+
+def test_schema_validator(sample_filepath, schema_filepath):
+    schema = load_schema(schema_filepath)
+    validator = SchemaValidator(schema)
+    data = load_sample(sample_filepath)
+    assert validator.validate(data)
+    assert validator.find_error(data) is None
+    assert load_validator(schema_filepath) is load_validator(schema_filepath)
+
+    invalid_data = copy.deepcopy(data)
+    del invalid_data["evolution"]["2020-03-20"]["weather"]["rainfall"]
+    assert validator.find_error(invalid_data) == ["evolution", "2020-03-20", "weather"]
+    assert not recursive_check(schema, invalid_data)
+
+    invalid_data = copy.deepcopy(data)
+    del invalid_data["evolution"]["2020-03-20"]["government_response"]["stringency_index"]
+    invalid_data["evolution"]["2020-03-20"]["government_response"]["anything"] = 1
+    assert validator.find_error(invalid_data) == ["evolution", "2020-03-20", "government_response"]
+
+    invalid_data = copy.deepcopy(data)
+    invalid_data["region"]["population"] = 12
+    assert validator.find_error(invalid_data) == ["region", "population"]
+
+    error, n_nodes = validator.find_error_counted(data)
+    assert error is None and n_nodes > 40
+    # Validation stops at the first error, before the daily entries
+    invalid_data = copy.deepcopy(data)
+    invalid_data["metadata"] = 12
+    assert validator.find_error_counted(invalid_data) == (["metadata"], 2)
+
+    assert validator.find_error([data]) == []
+    assert format_path([]) == "the top level"
+    assert format_path(["region", "population"]) == "'region'->'population'"
+
+
+def test_validate_data(sample_filepath, schema_filepath):
+    data = load_sample(sample_filepath)
+    schema = load_schema(schema_filepath)
+    for schema_argument in [schema_filepath, schema, SchemaValidator(schema)]:
+        assert validate_data(schema_argument, data)
+        assert not validate_data(schema_argument, {"metadata": data["metadata"]})
+    assert validate_schema(schema_filepath, sample_filepath)
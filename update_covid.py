@@ -0,0 +1,159 @@
+from collections import deque
+
+from process_covid import get_rebinning_plan, SCHEMA_FILEPATH
+from validate_schema import format_path, load_validator, SchemaValidator
+
+
+class IncrementalCovidAnalysis:
+    """
+    Analyses of one region kept up to date as new dates are appended, each new date costing O(window):
+    the results of `cases_per_population_by_age`, `hospital_vs_confirmed`, the running average of
+    new tests and `count_high_rain_low_tests_days` always match a full recompute on the same dates.
+    header: the region document's "metadata" and "region" entries ("evolution" is ignored).
+    window: window of the running average of new tests, also used for `count_high_rain_low_tests_days`.
+    """
+
+    def __init__(self, header, schema=SCHEMA_FILEPATH, window=7, validate=True):
+        if window % 2 == 0:
+            raise ValueError("'window' should be an odd integer")
+        if not isinstance(schema, dict):
+            schema = (schema if isinstance(schema, SchemaValidator) else load_validator(schema)).schema
+        if validate:
+            for key in ["metadata", "region"]:
+                error = SchemaValidator(schema[key]).find_error(header.get(key))
+                if error is not None:
+                    raise ValueError(f"Incorrect schema given at {format_path([key] + error)}")
+        self._date_validator = SchemaValidator(schema["evolution"]["<date>"])
+        self.metadata = header["metadata"]
+        self.region = header["region"]
+        self.window = window
+        self.dates = []
+        self._known_dates = set()
+
+        # cases_per_population_by_age: the first error met is raised when the result is requested
+        self._age_error = None
+        self._age_ratios = {}
+        try:
+            self._age_setup()
+        except ValueError as exception:
+            self._age_error = exception
+
+        # hospital_vs_confirmed
+        self._hospital_dates, self._hospital_ratios = [], []
+
+        # Running average of the new tests over the last `window` values, summed from left to right
+        # as in `compute_running_average`, so that float values give exactly the same averages
+        self._window_tests = deque(maxlen=window)
+        self._averages = []
+
+        # count_high_rain_low_tests_days
+        self._last_rain = None
+        self._rain_increased = []
+        self._n_rain_increased = 0
+        self._n_rain_increased_tests_decreased = 0
+
+    def _age_setup(self):
+        total_population = self.region["population"]["age"]
+        if None in total_population:
+            raise ValueError("Missing data at 'region'->'population'->'age'")
+        age_binning_population = self.metadata["age_binning"]["population"]
+        if len(age_binning_population) == 0:
+            raise ValueError("Age binning not provided for the population")
+        age_binning_cases = self.metadata["age_binning"]["hospitalizations"]
+        if len(age_binning_cases) == 0:
+            raise ValueError("Age binning not provided for the hospitalizations")
+        self._plan = get_rebinning_plan(age_binning_population, age_binning_cases)
+        self._population = self._plan.rebin(total_population, 0)
+        self._age_ratios = {age_bin: [] for age_bin in self._plan.age_binning}
+
+    @classmethod
+    def from_data(cls, input_data, schema=SCHEMA_FILEPATH, window=7, validate=True):
+        """Start from an already loaded (nested) region document, including its evolution."""
+        analysis = cls(input_data, schema, window, validate)
+        analysis.append(input_data["evolution"], validate)
+        return analysis
+
+    def append(self, new_evolution, validate=True):
+        """
+        Add the entries of `new_evolution` ({date: entry}, in chronological order) after the current dates.
+        Only these entries are validated, and all of them before any is added.
+        """
+        for date, entry in new_evolution.items():
+            if date in self._known_dates:
+                raise ValueError(f"Date {date} has already been added")
+            if validate:
+                error = self._date_validator.find_error(entry)
+                if error is not None:
+                    raise ValueError(f"Incorrect schema given at {format_path(['evolution', date] + error)}")
+
+        for date, entry in new_evolution.items():
+            self.dates.append(date)
+            self._known_dates.add(date)
+            self._update_age(date, entry)
+            self._update_hospital(date, entry)
+            self._update_rain_tests(entry)
+
+    def _update_age(self, date, entry):
+        if self._age_error is not None:
+            return
+        total_cases = entry["epidemiology"]["confirmed"]["total"]["age"]
+        if None in total_cases:
+            self._age_error = ValueError(
+                f"Missing data at 'evolution'->{date}->'epidemiology'->'confirmed'->'total'->'age'")
+            return
+        new_total_cases = self._plan.rebin(total_cases, 1)
+        for idx_age, age_bin in enumerate(self._plan.age_binning):
+            self._age_ratios[age_bin].append((date, new_total_cases[idx_age] / self._population[idx_age]))
+
+    def _update_hospital(self, date, entry):
+        n_hospitalized = entry["hospitalizations"]["hospitalized"]["new"]["all"]
+        n_cases = entry["epidemiology"]["confirmed"]["new"]["all"]
+        if n_hospitalized is None or n_cases is None:
+            return
+        self._hospital_dates.append(date)
+        self._hospital_ratios.append(n_hospitalized / n_cases)
+
+    def _update_rain_tests(self, entry):
+        rain = entry["weather"]["rainfall"]
+        rain_increased = self._last_rain is not None and rain is not None and rain - self._last_rain > 0
+        self._last_rain = rain
+        self._rain_increased.append(rain_increased)
+        self._n_rain_increased += rain_increased
+
+        self._window_tests.append(entry["epidemiology"]["tested"]["new"]["all"])
+        n = len(self._rain_increased)
+        if n < self.window:
+            return
+
+        # The average centred on `idx` can now be computed, and with it the derivative of the tests at `idx`
+        sum_window, n_values = 0, 0
+        for n_tests in self._window_tests:
+            if n_tests is not None:
+                sum_window += n_tests
+                n_values += 1
+        average = None if n_values == 0 else sum_window / n_values
+        previous_average = self._averages[-1] if self._averages else None
+        self._averages.append(average)
+        idx = n - 1 - (self.window - 1) // 2
+        if (self._rain_increased[idx] and average is not None and previous_average is not None
+                and average - previous_average < 0):
+            self._n_rain_increased_tests_decreased += 1
+
+    def cases_per_population_by_age(self):
+        if self._age_error is not None:
+            raise self._age_error
+        return {age_bin: list(ratios) for age_bin, ratios in self._age_ratios.items()}
+
+    def hospital_vs_confirmed(self):
+        return list(self._hospital_dates), list(self._hospital_ratios)
+
+    def running_average(self):
+        """Running average of the new tests, as `compute_running_average` over all the dates."""
+        n = len(self.dates)
+        if n < self.window:
+            return [None] * n
+        shift = (self.window - 1) // 2
+        return [None] * shift + self._averages + [None] * shift
+
+    def count_high_rain_low_tests_days(self):
+        return self._n_rain_increased_tests_decreased / self._n_rain_increased
@@ -1,4 +1,11 @@
+import hashlib
 import json
+import os
+
+import instrument_covid
+
+
+_validator_cache = {}
 
 
 def recursive_check(dict_schema, dict_data):
@@ -24,13 +31,161 @@ def recursive_check(dict_schema, dict_data):
     return True
 
 
+def _counted(check, counter):
+    def counted_check(dict_data):
+        counter[0] += 1
+        return check(dict_data)
+    return counted_check
+
+
+def _compile(dict_schema, counter=None):
+    """
+    Checker for one schema node: a function returning None when the data matches,
+    or the list of keys leading to the first mismatch. None if the node accepts anything.
+    counter: optional one-item list, incremented by every checker called, i.e. every node actually validated.
+    """
+    if not isinstance(dict_schema, dict):
+        return None
+
+    if dict_schema and next(iter(dict_schema)) == "<date>":
+        check_entry = _compile(dict_schema["<date>"], counter)
+
+        def check_dates(dict_data):
+            if not isinstance(dict_data, dict):
+                return []
+            if check_entry is not None:
+                for key, value in dict_data.items():
+                    error = check_entry(value)
+                    if error is not None:
+                        return [key] + error
+            return None
+        return check_dates if counter is None else _counted(check_dates, counter)
+
+    if "<various_parameters>" in dict_schema:
+        def check_parameters(dict_data):
+            if not isinstance(dict_data, dict) or 'stringency_index' not in dict_data:
+                return []
+            return None
+        return check_parameters if counter is None else _counted(check_parameters, counter)
+
+    keys = frozenset(dict_schema)
+    children = [(key, _compile(value, counter)) for key, value in dict_schema.items()]
+    children = [(key, check_child) for key, check_child in children if check_child is not None]
+
+    def check_keys(dict_data):
+        if not isinstance(dict_data, dict) or dict_data.keys() != keys:
+            return []
+        for key, check_child in children:
+            error = check_child(dict_data[key])
+            if error is not None:
+                return [key] + error
+        return None
+    return check_keys if counter is None else _counted(check_keys, counter)
+
+
+class SchemaValidator:
+    """
+    Schema compiled once into a tree of checkers, with the same rules as `recursive_check`.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self._check = _compile(schema) or (lambda json_data: None)
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        """Digest of the schema, computed once."""
+        if self._fingerprint is None:
+            self._fingerprint = _fingerprint(self.schema)
+        return self._fingerprint
+
+    def find_error(self, json_data):
+        """List of keys leading to the first node that does not match the schema, or None if the data is valid."""
+        return self._check(json_data)
+
+    def validate(self, json_data):
+        return self._check(json_data) is None
+
+    def find_error_counted(self, json_data):
+        """
+        `find_error`, with the number of nodes validated before it returned: validation stops at the first error.
+        The counting checkers are compiled for each call, so that concurrent calls keep separate counts.
+        """
+        counter = [0]
+        check = _compile(self.schema, counter) or (lambda json_data: None)
+        return check(json_data), counter[0]
+
+
+def load_schema(schema_filepath):
+    """
+    Parse the schema at `schema_filepath` once per process and return the cached copy afterwards.
+    The returned dict is shared between callers and must not be modified.
+    """
+    return load_validator(schema_filepath).schema
+
+
+def load_validator(schema_filepath):
+    """Compiled validator for the schema at `schema_filepath`, cached once per process."""
+    key = os.path.abspath(schema_filepath)
+    if key not in _validator_cache:
+        with open(schema_filepath) as schema_file:
+            _validator_cache[key] = SchemaValidator(json.load(schema_file))
+    return _validator_cache[key]
+
+
+def _get_validator(schema):
+    if isinstance(schema, SchemaValidator):
+        return schema
+    if isinstance(schema, dict):
+        return SchemaValidator(schema)
+    return load_validator(schema)
+
+
+def _fingerprint(dict_schema):
+    return hashlib.sha1(json.dumps(dict_schema, sort_keys=True).encode()).hexdigest()
+
+
+def schema_fingerprint(schema):
+    """
+    Digest of the content of `schema` (a filepath, a parsed dict or a `SchemaValidator`),
+    e.g. to tell which schema some cached data was validated against.
+    """
+    if isinstance(schema, dict):
+        return _fingerprint(schema)
+    return _get_validator(schema).fingerprint
+
+
+def find_schema_error(schema, json_data):
+    """
+    Path (list of keys) to the first node of an already parsed document that does not match `schema`,
+    or None if it matches. `schema` may be a filepath, a parsed dict or a `SchemaValidator`.
+    """
+    validator = _get_validator(schema)
+    if not instrument_covid.enabled:
+        return validator.find_error(json_data)
+    with instrument_covid.stage("validate"):
+        error, n_nodes = validator.find_error_counted(json_data)
+    instrument_covid.count("nodes_validated", n_nodes)
+    return error
+
+
+def format_path(keys):
+    return "->".join(f"'{key}'" for key in keys) or "the top level"
+
+
+def validate_data(schema, json_data):
+    """
+    Check an already parsed document against `schema`, given as a filepath, a parsed dict or a `SchemaValidator`.
+    """
+    return find_schema_error(schema, json_data) is None
+
+
 def validate_schema(schema_filepath, json_filepath):
-    with open(schema_filepath) as schema_file:
-        schema = json.load(schema_file)
     with open(json_filepath) as json_file:
         json_data = json.load(json_file)
 
-    return recursive_check(schema, json_data)
+    return validate_data(schema_filepath, json_data)
 
 
 if __name__ == "__main__":